@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+"""
+Local benchmarks for the HP LIFE extract and chef code (no network needed).
+Run this script on the command line using:
+    ./benchmark.py walk --latency 0.02 --workers 1 4 8 16 --batch-sizes 1 20
+    ./benchmark.py export --langs es fr --latency 0.02 --courses 5
+    ./benchmark.py xml --coursesdir chefdata/Courses
+    ./benchmark.py memory --coursesdir chefdata/Courses
+    ./benchmark.py links --coursesdir chefdata/Courses
+    ./benchmark.py tree --coursesdir chefdata/Courses --latency 0.002 --workers 1 8
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import extract
+from extract import gdrive_walk
+import libedx
+from fakedrive import FakeDrive, make_synthetic_tree
+from fakedrive import install_fake_drive, make_fake_data_sources, write_fake_data_sources
+
+
+
+# DRIVE WALK
+################################################################################
+
+def _walk_signature(triples):
+    """Order-independent summary of `gdrive_walk` output used to compare modes."""
+    return sorted((path, dirnames, [f['id'] for f in files]) for path, dirnames, files in triples)
+
+
+def benchmark_walk(latency=0.02, workers=(1, 4, 8, 16), batch_sizes=(1,), **tree_kwargs):
+    """
+    Time `gdrive_walk` over a synthetic "Activity Files" tree served by a
+    `FakeDrive` that sleeps `latency` seconds per API call, once for each
+    combination of `max_workers` in `workers` and `batch_size` in `batch_sizes`.
+    Checks all modes yield the same triples and reports the API calls used.
+    """
+    root_id, files = make_synthetic_tree(**tree_kwargs)
+    drive = FakeDrive(files, latency=latency)
+    print('Walking synthetic tree with', len(files), 'items, latency', latency, 's/call')
+
+    reference = None
+    results = []
+    for batch_size in batch_sizes:
+        for max_workers in workers:
+            drive.reset_calls()
+            start = time.time()
+            triples = list(gdrive_walk(root_id, drive=drive, max_workers=max_workers,
+                                       batch_size=batch_size))
+            elapsed = time.time() - start
+            signature = _walk_signature(triples)
+            if reference is None:
+                reference = signature
+            assert signature == reference, \
+                'walk with max_workers={} batch_size={} differs'.format(max_workers, batch_size)
+            calls = sum(drive.calls.values())
+            results.append(dict(max_workers=max_workers, batch_size=batch_size,
+                                elapsed=elapsed, calls=calls, folders=len(triples)))
+            print('  max_workers={:<3d} batch_size={:<3d} {:7.2f}s  {:5d} folders  {:5d} API calls'.format(
+                  max_workers, batch_size, elapsed, len(triples), calls))
+
+    baseline = results[0]
+    for result in results[1:]:
+        print('  max_workers={} batch_size={}: {:.1f}x faster, {:.0%} of the API calls'.format(
+              result['max_workers'], result['batch_size'],
+              baseline['elapsed'] / result['elapsed'], result['calls'] / baseline['calls']))
+    return results
+
+
+
+# END-TO-END EXPORT
+################################################################################
+
+def benchmark_export(langs=('es',), latency=0.02, courses=5, file_size=4096,
+                     max_workers=extract.DOWNLOAD_WORKERS, batch_size=extract.LIST_BATCH_SIZE,
+                     keep=False, **tree_kwargs):
+    """
+    Run walk -> export -> rename -> extract for `langs` against a `FakeDrive`
+    seeded to look like `chefdata/data_sources.json`, inside a temporary
+    working directory, and report the throughput of each step.
+    """
+    with open('chefdata/data_sources.json') as data_sources_file:
+        data_sources = json.load(data_sources_file)
+    data_sources = {lang: data_sources[lang] for lang in langs}
+    fake_data_sources, files, contents = make_fake_data_sources(
+        data_sources, courses=courses, file_size=file_size, **tree_kwargs)
+    drive = FakeDrive(files, latency=latency, contents=contents)
+    install_fake_drive(drive)
+    total_bytes = sum(len(data) for data in contents.values())
+    print('Fake Drive with', len(files), 'items,', len(contents), 'files,',
+          '{:.1f} MB,'.format(total_bytes / 1e6), 'latency', latency, 's/call')
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='hplife-benchmark-')
+    results = {}
+    try:
+        os.chdir(workdir)
+        write_fake_data_sources(fake_data_sources)
+        for lang in langs:
+            lang_sources = fake_data_sources[lang]
+            lang_files = _lang_files(files, lang_sources)
+            lang_count = len(lang_files)
+            lang_bytes = sum(int(f['size']) for f in lang_files)
+            results[lang] = timings = {}
+
+            drive.reset_calls()
+            start = time.time()
+            folders = 0
+            for kind in ['courses', 'activityfiles']:
+                folders += len(list(gdrive_walk(lang_sources[kind]['folder_id'], drive=drive,
+                                                max_workers=max_workers, batch_size=batch_size)))
+            timings['walk'] = time.time() - start
+            print('[{}] walk     {:7.2f}s  {:6.1f} folders/s  {} API calls'.format(
+                  lang, timings['walk'], folders / timings['walk'], sum(drive.calls.values())))
+
+            drive.reset_calls()
+            extract.api_call_counts(reset=True)
+            start = time.time()
+            extract.export(lang=lang, max_workers=max_workers, batch_size=batch_size)
+            timings['export'] = time.time() - start
+            print('[{}] export   {:7.2f}s  {:6.1f} files/s  {:6.2f} MB/s  {} get_media calls'.format(
+                  lang, timings['export'], lang_count / timings['export'],
+                  lang_bytes / 1e6 / timings['export'], drive.calls.get('get_media', 0)))
+
+            start = time.time()
+            extract.rename_courses(lang=lang)
+            extract.rename_activity_files(lang=lang)
+            timings['rename'] = time.time() - start
+            print('[{}] rename   {:7.2f}s  {:6.1f} files/s'.format(
+                  lang, timings['rename'], lang_count / timings['rename']))
+
+            start = time.time()
+            extract.extract(lang=lang)
+            timings['extract'] = time.time() - start
+            print('[{}] extract  {:7.2f}s  {:6.1f} courses/s'.format(
+                  lang, timings['extract'], courses / timings['extract']))
+    finally:
+        os.chdir(cwd)
+        if keep:
+            print('Kept working directory', workdir)
+        else:
+            shutil.rmtree(workdir)
+    return results
+
+
+def _lang_files(files, lang_sources):
+    """The non-folder files under the courses and activity files folders of one language."""
+    root_ids = {lang_sources[kind]['folder_id'] for kind in ['courses', 'activityfiles']}
+    folder_roots = {}
+    def root_of(file_id):
+        if file_id not in folder_roots:
+            parents = files[file_id]['parents']
+            folder_roots[file_id] = file_id if not parents else root_of(parents[0])
+        return folder_roots[file_id]
+    return [f for f in files.values()
+            if f['mimeType'] != extract.FOLDER_MIMETYPE and root_of(f['id']) in root_ids]
+
+
+
+# XML PARSING
+################################################################################
+
+XML_PARSE_FUNCTIONS = {
+    'chapter': libedx.parse_xml_file,
+    'sequential': libedx.parse_xml_file,
+    'vertical': libedx.parse_xml_file,
+    'problem': libedx.parse_problem_file,
+}
+
+
+def _iter_course_xml_files(coursesdir='chefdata/Courses'):
+    """
+    Yield `(parse_fn, coursedir, kind, name)` for every XML file under the
+    extracted courses `{coursesdir}/{lang}/{course_name}/course/{kind}/{name}.xml`.
+    """
+    for lang in sorted(os.listdir(coursesdir)):
+        langdir = os.path.join(coursesdir, lang)
+        if not os.path.isdir(langdir):
+            continue
+        for course_name in sorted(os.listdir(langdir)):
+            coursedir = os.path.join(langdir, course_name, 'course')
+            for kind, parse_fn in XML_PARSE_FUNCTIONS.items():
+                kinddir = os.path.join(coursedir, kind)
+                if not os.path.isdir(kinddir):
+                    continue
+                for filename in sorted(os.listdir(kinddir)):
+                    if filename.endswith('.xml'):
+                        yield parse_fn, coursedir, kind, filename[:-len('.xml')]
+
+
+def _parse_or_error(parse_fn, coursedir, kind, name):
+    try:
+        return parse_fn(coursedir, kind, name)
+    except Exception as e:
+        return 'ERROR: ' + type(e).__name__
+
+
+def _course_tree_outputs(coursedir, backends=libedx.XML_BACKENDS):
+    """
+    Return {(backend, lazy, node_model): json} for the tree of `coursedir` loaded
+    with every combination of XML backend, lazy HTML content, and node model.
+    """
+    original = libedx.XML_BACKEND, libedx.LAZY_HTML_CONTENT, libedx.NODE_MODEL
+    outputs = {}
+    try:
+        for config in itertools.product(backends, [False, True], libedx.NODE_MODELS):
+            libedx.XML_BACKEND, libedx.LAZY_HTML_CONTENT, libedx.NODE_MODEL = config
+            try:
+                outputs[config] = libedx.dumps_course(libedx.extract_course_tree(coursedir))
+            except Exception as e:
+                outputs[config] = 'ERROR: ' + type(e).__name__
+    finally:
+        libedx.XML_BACKEND, libedx.LAZY_HTML_CONTENT, libedx.NODE_MODEL = original
+    return outputs
+
+
+def check_tree_parity(coursesdir='chefdata/Courses', backends=libedx.XML_BACKENDS):
+    """
+    Load every course in `coursesdir` with all backends and modes (see
+    `_course_tree_outputs`), print the ones whose trees differ, and return
+    the number of mismatches.
+    """
+    mismatches = 0
+    for coursedir in _iter_coursedirs(coursesdir):
+        with contextlib.redirect_stdout(io.StringIO()):   # mute "unexpected problem type"
+            outputs = _course_tree_outputs(coursedir, backends=backends)
+        configs = list(outputs)
+        for config in configs[1:]:
+            if outputs[config] != outputs[configs[0]]:
+                mismatches += 1
+                print('  MISMATCH', config, 'vs', configs[0], coursedir)
+    return mismatches
+
+
+def benchmark_xml(coursesdir='chefdata/Courses', backends=libedx.XML_BACKENDS, repeat=3):
+    """
+    Parse every course XML file in `coursesdir` with each of the `libedx.XML_BACKENDS`,
+    check that all backends return the same data, and report the time per file.
+    The course trees are also compared across backends, lazy/eager HTML content,
+    and node models. Raises ValueError if any of the outputs differ.
+    """
+    jobs = list(_iter_course_xml_files(coursesdir))
+    if not jobs:
+        print('No extracted course XML files found in', coursesdir)
+        return None
+    print('Parsing', len(jobs), 'XML files from', coursesdir)
+
+    original_backend = libedx.XML_BACKEND
+    results = {}
+    outputs = {}
+    try:
+        for backend in backends:
+            libedx.XML_BACKEND = backend
+            with contextlib.redirect_stdout(io.StringIO()):   # mute "unexpected problem type"
+                outputs[backend] = [_parse_or_error(*job) for job in jobs]
+                start = time.time()
+                for _ in range(repeat):
+                    for job in jobs:
+                        _parse_or_error(*job)
+            elapsed = (time.time() - start) / repeat
+            results[backend] = elapsed
+            print('  {:<5s} {:7.3f}s  {:7.1f} us/file'.format(backend, elapsed, elapsed / len(jobs) * 1e6))
+    finally:
+        libedx.XML_BACKEND = original_backend
+
+    reference_backend = backends[0]
+    mismatches = 0
+    for backend in backends[1:]:
+        for job, expected, actual in zip(jobs, outputs[reference_backend], outputs[backend]):
+            if expected != actual:
+                mismatches += 1
+                _, coursedir, kind, name = job
+                print('  MISMATCH', backend, 'vs', reference_backend, os.path.join(coursedir, kind, name))
+        print('  {} is {:.1f}x faster than {}'.format(
+              reference_backend, results[backend] / results[reference_backend], backend))
+    mismatches += check_tree_parity(coursesdir, backends=backends)
+    print('  parity:', 'OK' if mismatches == 0 else '{} mismatches'.format(mismatches))
+    if mismatches:
+        raise ValueError('XML parity check failed with {} mismatches'.format(mismatches))
+    return results
+
+
+
+# MEMORY
+################################################################################
+
+def _iter_coursedirs(coursesdir='chefdata/Courses'):
+    for lang in sorted(os.listdir(coursesdir)):
+        langdir = os.path.join(coursesdir, lang)
+        if not os.path.isdir(langdir):
+            continue
+        for course_name in sorted(os.listdir(langdir)):
+            coursedir = os.path.join(langdir, course_name, 'course')
+            if os.path.isdir(coursedir):
+                yield coursedir
+
+
+def benchmark_memory(coursesdir='chefdata/Courses'):
+    """
+    Load the trees of all courses in `coursesdir` and keep them alive, like
+    `pre_run` does, with eager or lazy HTML content (`libedx.LAZY_HTML_CONTENT`)
+    and dict or slotted nodes (`libedx.NODE_MODEL`), and report the memory
+    retained and peak memory measured with tracemalloc. The recently read HTML
+    kept by libedx (at most `libedx.HTML_TEXT_CACHE_BYTES`) is not counted.
+    """
+    coursedirs = list(_iter_coursedirs(coursesdir))
+    if not coursedirs:
+        print('No extracted courses found in', coursesdir)
+        return None
+    print('Loading', len(coursedirs), 'course trees from', coursesdir)
+
+    configs = [(False, 'dict'), (True, 'dict'), (True, 'slots')]
+    original = libedx.LAZY_HTML_CONTENT, libedx.NODE_MODEL
+    results = {}
+    try:
+        for lazy, node_model in configs:
+            libedx.LAZY_HTML_CONTENT, libedx.NODE_MODEL = lazy, node_model
+            libedx.clear_html_text_cache()
+            tracemalloc.start()
+            trees = [libedx.extract_course_tree(coursedir) for coursedir in coursedirs]
+            libedx.clear_html_text_cache()   # bounded by HTML_TEXT_CACHE_BYTES, not retained by the trees
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del trees
+            mode = '{} content, {} nodes'.format('lazy' if lazy else 'eager', node_model)
+            results[mode] = dict(current=current, peak=peak)
+            print('  {:<26s} {:8.2f} MB retained  {:8.2f} MB peak'.format(
+                  mode + ':', current / 1e6, peak / 1e6))
+    finally:
+        libedx.LAZY_HTML_CONTENT, libedx.NODE_MODEL = original
+    baseline = results['eager content, dict nodes']['current']
+    for mode, result in list(results.items())[1:]:
+        print('  {} retains {:.0%} of the memory of eager content, dict nodes'.format(
+              mode, result['current'] / baseline))
+    return results
+
+
+
+# LINK SCANNER
+################################################################################
+
+def benchmark_links(coursesdir='chefdata/Courses', scanners=libedx.LINK_SCANNERS, repeat=3):
+    """
+    Run `parse_html_file` on every course HTML file in `coursesdir` with each of
+    the `libedx.LINK_SCANNERS`, check that the `activity` classifications are
+    identical, and report the time per file.
+    """
+    jobs = []
+    for coursedir in _iter_coursedirs(coursesdir):
+        htmldir = os.path.join(coursedir, 'html')
+        if os.path.isdir(htmldir):
+            jobs.extend((coursedir, filename[:-len('.html')])
+                        for filename in sorted(os.listdir(htmldir)) if filename.endswith('.html'))
+    if not jobs:
+        print('No extracted course HTML files found in', coursesdir)
+        return None
+    print('Scanning', len(jobs), 'HTML files from', coursesdir)
+
+    original_scanner = libedx.LINK_SCANNER
+    results = {}
+    activities = {}
+    try:
+        for scanner in scanners:
+            libedx.LINK_SCANNER = scanner
+            start = time.time()
+            for _ in range(repeat):
+                activities[scanner] = [libedx.parse_html_file(coursedir, 'html', name).get('activity')
+                                       for coursedir, name in jobs]
+            elapsed = (time.time() - start) / repeat
+            results[scanner] = elapsed
+            found = sum(1 for activity in activities[scanner] if activity)
+            print('  {:<8s} {:7.3f}s  {:7.1f} us/file  {} resources folders'.format(
+                  scanner, elapsed, elapsed / len(jobs) * 1e6, found))
+    finally:
+        libedx.LINK_SCANNER = original_scanner
+
+    reference_scanner = scanners[0]
+    mismatches = 0
+    for scanner in scanners[1:]:
+        for job, expected, actual in zip(jobs, activities[reference_scanner], activities[scanner]):
+            if expected != actual:
+                mismatches += 1
+                coursedir, name = job
+                print('  MISMATCH', scanner, 'vs', reference_scanner, os.path.join(coursedir, 'html', name))
+        print('  {} is {:.1f}x faster than {}'.format(
+              reference_scanner, results[scanner] / results[reference_scanner], scanner))
+    print('  parity:', 'OK' if mismatches == 0 else '{} mismatches'.format(mismatches))
+    return results
+
+
+
+# COURSE TREE
+################################################################################
+
+class SlowDirSource(libedx.DirSource):
+    """A `DirSource` that sleeps `latency` seconds per file read (network filesystem)."""
+    def __init__(self, coursedir, latency):
+        super().__init__(coursedir)
+        self.latency = latency
+
+    def read_text(self, relpath):
+        time.sleep(self.latency)
+        return super().read_text(relpath)
+
+
+def benchmark_tree(coursesdir='chefdata/Courses', latency=0.0, workers=(1, 8)):
+    """
+    Time `extract_course_tree` for all courses in `coursesdir` for each of the
+    `max_workers` in `workers`, reading files with `latency` seconds of delay,
+    and check all modes return the same trees.
+    """
+    coursedirs = list(_iter_coursedirs(coursesdir))
+    if not coursedirs:
+        print('No extracted courses found in', coursesdir)
+        return None
+    print('Loading', len(coursedirs), 'course trees from', coursesdir, 'latency', latency, 's/file')
+    results = {}
+    reference = None
+    for max_workers in workers:
+        start = time.time()
+        trees = [libedx.extract_course_tree(SlowDirSource(coursedir, latency), max_workers=max_workers)
+                 for coursedir in coursedirs]
+        elapsed = time.time() - start
+        if reference is None:
+            reference = trees
+        assert trees == reference, 'trees with max_workers={} differ'.format(max_workers)
+        results[max_workers] = elapsed
+        print('  max_workers={:<3d} {:7.2f}s'.format(max_workers, elapsed))
+    baseline = results[workers[0]]
+    for max_workers in workers[1:]:
+        print('  max_workers={}: {:.1f}x faster'.format(max_workers, baseline / results[max_workers]))
+    return results
+
+
+
+# CLI
+################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='HP LIFE local benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    walk_parser = subparsers.add_parser('walk', help='concurrent gdrive_walk vs. serial')
+    walk_parser.add_argument('--latency', type=float, default=0.02, help='seconds per API call')
+    walk_parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    walk_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 20])
+    walk_parser.add_argument('--courses', type=int, default=10)
+
+    export_parser = subparsers.add_parser('export', help='walk, download, rename, and extract')
+    export_parser.add_argument('--langs', nargs='+', default=['es'])
+    export_parser.add_argument('--latency', type=float, default=0.02, help='seconds per API call')
+    export_parser.add_argument('--courses', type=int, default=5, help='courses per language')
+    export_parser.add_argument('--file-size', type=int, default=4096, help='bytes per activity file')
+    export_parser.add_argument('--workers', type=int, default=extract.DOWNLOAD_WORKERS)
+    export_parser.add_argument('--batch-size', type=int, default=extract.LIST_BATCH_SIZE)
+    export_parser.add_argument('--keep', action='store_true', help='keep the temporary chefdata/')
+    xml_parser = subparsers.add_parser('xml', help='lxml vs. BeautifulSoup parsing of course XML')
+    xml_parser.add_argument('--coursesdir', default='chefdata/Courses')
+    xml_parser.add_argument('--repeat', type=int, default=3)
+    memory_parser = subparsers.add_parser('memory', help='memory used by course trees (lazy content, slotted nodes)')
+    memory_parser.add_argument('--coursesdir', default='chefdata/Courses')
+    links_parser = subparsers.add_parser('links', help='fast vs. html5lib resources-folder detection')
+    links_parser.add_argument('--coursesdir', default='chefdata/Courses')
+    links_parser.add_argument('--repeat', type=int, default=3)
+    tree_parser = subparsers.add_parser('tree', help='serial vs. level-by-level course tree loading')
+    tree_parser.add_argument('--coursesdir', default='chefdata/Courses')
+    tree_parser.add_argument('--latency', type=float, default=0.002, help='seconds per file read')
+    tree_parser.add_argument('--workers', type=int, nargs='+', default=[1, 8])
+    args = parser.parse_args()
+
+    if args.benchmark == 'walk':
+        benchmark_walk(latency=args.latency, workers=args.workers, batch_sizes=args.batch_sizes,
+                       courses=args.courses)
+    elif args.benchmark == 'export':
+        benchmark_export(langs=args.langs, latency=args.latency, courses=args.courses,
+                         file_size=args.file_size, max_workers=args.workers,
+                         batch_size=args.batch_size, keep=args.keep)
+    elif args.benchmark == 'xml':
+        benchmark_xml(coursesdir=args.coursesdir, repeat=args.repeat)
+    elif args.benchmark == 'memory':
+        benchmark_memory(coursesdir=args.coursesdir)
+    elif args.benchmark == 'links':
+        benchmark_links(coursesdir=args.coursesdir, repeat=args.repeat)
+    elif args.benchmark == 'tree':
+        benchmark_tree(coursesdir=args.coursesdir, latency=args.latency, workers=args.workers)
+    else:
+        parser.print_help()
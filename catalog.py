@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+"""
+SQLite catalog of the HP LIFE courses, chapters, activities, downloadable
+resources, and output artifacts for all languages, built from the courses in
+`chefdata/Courses/{lang}/course_list.json` using `libedx`.
+Run this script on the command line using:
+    ./catalog.py update --langs es fr    # parse new or changed courses only
+    ./catalog.py missing                 # list activity folders not found in content/
+    ./catalog.py sql "SELECT lang, COUNT(*) FROM courses GROUP BY lang"
+"""
+import argparse
+from bs4 import BeautifulSoup
+import json
+import os
+import sqlite3
+import time
+
+from libedx import extract_course_tree, file_fingerprint, open_course_source
+from sushichef import COURSES_DIR, CONTENT_FOLDER_RENAMES, HPLIFE_LANGS
+from sushichef import ContentIndex, find_activity_ref, get_course_dirs, parse_course_tree
+from transform import ASSETS_URL
+
+
+CATALOG_PATH = 'chefdata/catalog.sqlite3'
+CATALOG_VERSION = 1     # bump to re-parse all courses when the catalog code changes
+ARTIFACT_DIRNAMES = ['downloads', 'converted', 'extracted']   # outputs in content/
+ACTIVITY_ROLES = ['story', 'businessconcept', 'technologyskill', 'downloadable_resources']
+
+
+
+# SCHEMA
+################################################################################
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    course_key TEXT PRIMARY KEY,     -- {lang}/{path}
+    lang TEXT NOT NULL,
+    name TEXT NOT NULL,
+    source_id TEXT,                  -- course id from course.xml, e.g. 2355hpl-es06
+    display_name TEXT,
+    coursedir TEXT NOT NULL,
+    contentdir TEXT NOT NULL,
+    fingerprint TEXT,                -- see `_course_fingerprint`
+    error TEXT,                      -- parse or structure error, NULL if ok
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS courses_lang ON courses (lang);
+CREATE INDEX IF NOT EXISTS courses_source_id ON courses (source_id);
+
+CREATE TABLE IF NOT EXISTS chapters (
+    course_key TEXT NOT NULL REFERENCES courses (course_key) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    url_name TEXT,
+    display_name TEXT
+);
+CREATE INDEX IF NOT EXISTS chapters_course_key ON chapters (course_key);
+
+CREATE TABLE IF NOT EXISTS activities (
+    course_key TEXT NOT NULL REFERENCES courses (course_key) ON DELETE CASCADE,
+    chapter_position INTEGER,
+    role TEXT,                       -- key in parsed_tree, e.g. story, or NULL
+    url_name TEXT,
+    kind TEXT NOT NULL,              -- articulate_storyline, hpstoryline, or resources_folder
+    activity_ref TEXT,
+    story_id TEXT,
+    bucket_url TEXT,
+    bucket_path TEXT,
+    entrypoint TEXT,
+    url TEXT,
+    found INTEGER                    -- 1 if the activity folder is in content/, NULL if n/a
+);
+CREATE INDEX IF NOT EXISTS activities_course_key ON activities (course_key);
+CREATE INDEX IF NOT EXISTS activities_kind ON activities (kind);
+CREATE INDEX IF NOT EXISTS activities_activity_ref ON activities (activity_ref);
+CREATE INDEX IF NOT EXISTS activities_story_id ON activities (story_id);
+
+CREATE TABLE IF NOT EXISTS resources (
+    course_key TEXT NOT NULL REFERENCES courses (course_key) ON DELETE CASCADE,
+    title TEXT,
+    url TEXT NOT NULL,
+    filename TEXT
+);
+CREATE INDEX IF NOT EXISTS resources_course_key ON resources (course_key);
+CREATE INDEX IF NOT EXISTS resources_url ON resources (url);
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    course_key TEXT NOT NULL REFERENCES courses (course_key) ON DELETE CASCADE,
+    kind TEXT NOT NULL,              -- one of ARTIFACT_DIRNAMES
+    relpath TEXT NOT NULL,           -- relative to contentdir
+    size INTEGER,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS artifacts_course_key ON artifacts (course_key);
+"""
+
+
+def open_catalog(path=CATALOG_PATH):
+    """
+    Open (and create if needed) the catalog database at `path`.
+    """
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+
+# FINGERPRINTS
+################################################################################
+# A course is re-parsed only if one of the source files its tree was built from
+# changed, or if the folders in its content/ dir or in its candidate folders
+# changed (they determine `found`, see `sushichef.ContentIndex`).
+
+def _content_listing(contentdir):
+    if not os.path.isdir(contentdir):
+        return []
+    content_index = ContentIndex(contentdir)
+    return sorted(relpath for relpaths in content_index.paths.values() for relpath in relpaths)
+
+
+def _course_fingerprint(paths, contentdir):
+    fingerprint = {
+        'version': CATALOG_VERSION,
+        'sources': {path: file_fingerprint(path) for path in paths},
+        'content': _content_listing(contentdir),
+    }
+    return json.dumps(fingerprint, sort_keys=True)
+
+
+def _is_unchanged(stored_fingerprint, contentdir):
+    if not stored_fingerprint:
+        return False
+    stored = json.loads(stored_fingerprint)
+    paths = list(stored['sources'].keys())
+    return _course_fingerprint(paths, contentdir) == stored_fingerprint
+
+
+
+# EXTRACT ROWS
+################################################################################
+
+def _iter_activity_nodes(course_data):
+    """
+    Yield `(chapter_position, node)` for every node in the course tree that
+    has an `activity`.
+    """
+    for position, chapter in enumerate(course_data.get('children', [])):
+        stack = [chapter]
+        while stack:
+            node = stack.pop()
+            if 'activity' in node:
+                yield position, node
+            stack.extend(reversed(node.get('children', [])))
+
+
+def _resolve_activity_ref(course_id, role, activity_ref):
+    renames = CONTENT_FOLDER_RENAMES.get(course_id, {}).get(role, {})
+    return renames.get(activity_ref, activity_ref)
+
+
+def _activity_found(activity, contentdir, course_id, role, content_index=None):
+    if content_index is None:
+        return 0    # no content/ dir
+    if activity['kind'] == 'hpstoryline':
+        return int(os.path.exists(os.path.join(contentdir, activity['story_id'])))
+    if activity['kind'] == 'articulate_storyline':
+        activity_ref = _resolve_activity_ref(course_id, role, activity['activity_ref'])
+        return int(find_activity_ref(contentdir, activity_ref, content_index) is not None)
+    return None
+
+
+def _downloadable_resources(item, course_id):
+    """
+    The links of the downloadable resources HTML item as `(title, url, filename)`,
+    like `transform.get_resources_from_downloadable_resouces_item` but without
+    the HEAD requests.
+    """
+    rows = []
+    doc = BeautifulSoup(str(item['content']), 'html5lib')
+    for link in doc.find_all('a'):
+        if not link.has_attr('href'):
+            continue
+        href = link['href'].strip()
+        filename = os.path.basename(href)
+        url = ASSETS_URL.format(course_id=course_id, filename=filename) if href.startswith('/') else href
+        rows.append((link.text.strip(), url, filename))
+    return rows
+
+
+def _scan_artifacts(contentdir):
+    rows = []
+    for kind in ARTIFACT_DIRNAMES:
+        artifactsdir = os.path.join(contentdir, kind)
+        if not os.path.isdir(artifactsdir):
+            continue
+        for entry in os.scandir(artifactsdir):
+            if entry.is_file():
+                stat = entry.stat()
+                rows.append((kind, os.path.join(kind, entry.name), stat.st_size, stat.st_mtime))
+    return rows
+
+
+
+# UPDATE
+################################################################################
+
+def _delete_course_rows(conn, course_key, tables=('chapters', 'activities', 'resources')):
+    for table in tables:
+        conn.execute('DELETE FROM {} WHERE course_key = ?'.format(table), (course_key,))
+
+
+def update_course(conn, course, containerdir, force=False):
+    """
+    Parse `course` (an entry of `course_list.json`) and store its rows, unless
+    the stored fingerprint shows nothing changed since the last update.
+    Artifacts are always re-scanned. Returns True if the course was parsed.
+    """
+    lang = course['lang']
+    course_key = lang + '/' + course['path']
+    coursedir, contentdir = get_course_dirs(course, containerdir)
+
+    row = conn.execute('SELECT fingerprint FROM courses WHERE course_key = ?', (course_key,)).fetchone()
+    parsed = force or row is None or not _is_unchanged(row['fingerprint'], contentdir)
+    if parsed:
+        _delete_course_rows(conn, course_key)
+        source = open_course_source(coursedir)
+        source_id, display_name, error = None, None, None
+        try:
+            course_data = extract_course_tree(source)
+        except Exception as e:
+            course_data, error = None, 'parse: {}: {}'.format(type(e).__name__, e)
+        parsed_tree = None
+        if course_data is not None:
+            source_id = course_data.get('course')
+            display_name = course_data.get('display_name')
+            try:
+                parsed_tree = parse_course_tree(course_data, lang)
+            except (AssertionError, IndexError, KeyError) as e:
+                error = 'structure: {}: {}'.format(type(e).__name__, e)
+
+        # a failed parse may not have read all of the course's files, so it is retried next time
+        fingerprint = _course_fingerprint(source.touched_paths(), contentdir) if course_data else None
+        conn.execute('INSERT OR REPLACE INTO courses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     (course_key, lang, course['name'], source_id, display_name, coursedir,
+                      contentdir, fingerprint, error, time.time()))
+
+        if course_data is not None:
+            roles = {}
+            if parsed_tree:
+                roles = {id(parsed_tree[role]): role for role in ACTIVITY_ROLES if parsed_tree[role]}
+            conn.executemany('INSERT INTO chapters VALUES (?, ?, ?, ?)',
+                             [(course_key, position, chapter.get('url_name', chapter.get('id')),
+                               chapter.get('display_name'))
+                              for position, chapter in enumerate(course_data.get('children', []))])
+            activity_rows = []
+            content_index = ContentIndex(contentdir) if os.path.isdir(contentdir) else None
+            for position, node in _iter_activity_nodes(course_data):
+                activity = node['activity']
+                role = roles.get(id(node))
+                activity_rows.append((
+                    course_key, position, role, node.get('url_name'), activity['kind'],
+                    activity.get('activity_ref'), activity.get('story_id'), activity.get('bucket_url'),
+                    activity.get('bucket_path'), activity.get('entrypoint'), activity.get('url'),
+                    _activity_found(activity, contentdir, source_id, role, content_index)))
+            conn.executemany('INSERT INTO activities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             activity_rows)
+            if parsed_tree and parsed_tree['downloadable_resources']:
+                conn.executemany('INSERT INTO resources VALUES (?, ?, ?, ?)',
+                                 [(course_key,) + resource for resource in
+                                  _downloadable_resources(parsed_tree['downloadable_resources'], source_id)])
+
+    _delete_course_rows(conn, course_key, tables=('artifacts',))
+    conn.executemany('INSERT INTO artifacts VALUES (?, ?, ?, ?, ?)',
+                     [(course_key,) + artifact for artifact in _scan_artifacts(contentdir)])
+    return parsed
+
+
+def update_catalog(conn, langs=HPLIFE_LANGS, force=False):
+    """
+    Bring the catalog up to date with `chefdata/Courses/{lang}/course_list.json`
+    for all `langs`: parse new and changed courses and drop removed ones.
+    """
+    start = time.time()
+    counts = dict(parsed=0, unchanged=0, removed=0)
+    for lang in langs:
+        containerdir = os.path.join(COURSES_DIR, lang)
+        course_list_path = os.path.join(containerdir, 'course_list.json')
+        if not os.path.exists(course_list_path):
+            print('No course_list.json for lang', lang)
+            continue
+        with open(course_list_path) as course_list_file:
+            course_list = json.load(course_list_file)
+        course_keys = set()
+        with conn:
+            for course in course_list['courses']:
+                course_keys.add(lang + '/' + course['path'])
+                if update_course(conn, course, containerdir, force=force):
+                    counts['parsed'] += 1
+                else:
+                    counts['unchanged'] += 1
+            stored_keys = [row['course_key'] for row in
+                           conn.execute('SELECT course_key FROM courses WHERE lang = ?', (lang,))]
+            for course_key in stored_keys:
+                if course_key not in course_keys:
+                    conn.execute('DELETE FROM courses WHERE course_key = ?', (course_key,))
+                    counts['removed'] += 1
+    print('Catalog updated in {:.1f}s: {parsed} courses parsed, {unchanged} unchanged, '
+          '{removed} removed'.format(time.time() - start, **counts))
+    return counts
+
+
+
+# REPORTS
+################################################################################
+
+def missing_activities(conn, langs=HPLIFE_LANGS):
+    """
+    Return the activities whose folder is missing from the course's content/ dir.
+    """
+    placeholders = ','.join('?' * len(langs))
+    return conn.execute(
+        'SELECT courses.lang, courses.name, activities.role, activities.kind, '
+        'activities.activity_ref, activities.story_id FROM activities '
+        'JOIN courses USING (course_key) '
+        'WHERE activities.found = 0 AND courses.lang IN ({}) '
+        'ORDER BY courses.lang, courses.name'.format(placeholders), list(langs)).fetchall()
+
+
+def print_rows(rows):
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
+
+
+
+# CLI
+################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='HP LIFE courses catalog')
+    parser.add_argument('--db', default=CATALOG_PATH, help='path to the SQLite catalog')
+    subparsers = parser.add_subparsers(dest='command')
+    update_parser = subparsers.add_parser('update', help='parse new or changed courses')
+    update_parser.add_argument('--langs', nargs='+', choices=HPLIFE_LANGS, default=HPLIFE_LANGS)
+    update_parser.add_argument('--force', action='store_true', help='re-parse all courses')
+    missing_parser = subparsers.add_parser('missing', help='list activity folders missing from content/')
+    missing_parser.add_argument('--langs', nargs='+', choices=HPLIFE_LANGS, default=HPLIFE_LANGS)
+    sql_parser = subparsers.add_parser('sql', help='run a query on the catalog')
+    sql_parser.add_argument('query')
+    args = parser.parse_args()
+
+    conn = open_catalog(args.db)
+    if args.command == 'update':
+        update_catalog(conn, langs=args.langs, force=args.force)
+    elif args.command == 'missing':
+        print_rows(missing_activities(conn, langs=args.langs))
+    elif args.command == 'sql':
+        print_rows(conn.execute(args.query).fetchall())
+    else:
+        parser.print_help()
+    conn.close()
@@ -1,17 +1,32 @@
 #!/usr/bin/env python
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import fnmatch
+import hashlib
 import io
 import json
 import os
 import pickle
+import random
 import re
 import shutil
+import tempfile
+import threading
+import time
 
+try:
+    import fcntl   # for reflinks (Linux only)
+except ImportError:
+    fcntl = None
 
 
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.errors import HttpError
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 
 
 
@@ -39,11 +54,14 @@ class MemoryCache():
 
 
 
-def get_service(service_name=None, service_version=None):
-    creds = None
+def load_credentials(creds=None):
+    """
+    Return valid OAuth credentials, refreshing `creds` or the ones saved in
+    `CLIENT_TOKEN_PICKLE` if needed, or running the login flow if there are none.
+    """
     # The file credentials/token.pickle stores the user access and refresh tokens
     # it is created automatically after the first authorization flow completes
-    if os.path.exists(CLIENT_TOKEN_PICKLE):
+    if creds is None and os.path.exists(CLIENT_TOKEN_PICKLE):
         with open(CLIENT_TOKEN_PICKLE, 'rb') as token:
             creds = pickle.load(token)
     # If there are no (valid) credentials available, let the user log in
@@ -56,8 +74,193 @@ def get_service(service_name=None, service_version=None):
         # Save the credentials for the next run
         with open(CLIENT_TOKEN_PICKLE, 'wb') as token:
             pickle.dump(creds, token)
-    service = build(service_name, service_version, credentials=creds, cache=MemoryCache())
-    return service
+    return creds
+
+
+class ServiceFactory():
+    """
+    Process-wide source of Google API service objects. Credentials are loaded
+    once (and refreshed when they expire) and each API's discovery document is
+    fetched once. Every thread gets its own service with its own authorized
+    `httplib2.Http` connection, since httplib2 is not thread-safe.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._creds = None
+        self._discovery_docs = {}
+        self._local = threading.local()
+
+    def get_credentials(self):
+        with self._lock:
+            if self._creds is None or not self._creds.valid:
+                self._creds = load_credentials(self._creds)
+            return self._creds
+
+    def get_service(self, service_name, service_version):
+        services = self._local.__dict__.setdefault('services', {})
+        key = (service_name, service_version)
+        if key not in services:
+            creds = self.get_credentials()
+            with self._lock:
+                doc = self._discovery_docs.get(key)
+                if doc is None:
+                    service = build(service_name, service_version, credentials=creds,
+                                    cache=MemoryCache())
+                    self._discovery_docs[key] = service._rootDesc
+                    services[key] = service
+                    return service
+            http = AuthorizedHttp(creds, http=httplib2.Http())
+            services[key] = build_from_document(doc, http=http)
+        return services[key]
+
+
+SERVICE_FACTORY = ServiceFactory()
+
+
+def get_service(service_name=None, service_version=None):
+    """
+    Return the service for the calling thread from the shared `SERVICE_FACTORY`.
+    """
+    return SERVICE_FACTORY.get_service(service_name, service_version)
+
+
+
+# THROTTLE
+################################################################################
+
+# Count of API calls made by this process, by method (see `api_call_counts`)
+API_CALLS = Counter()
+_API_CALLS_LOCK = threading.Lock()
+
+def _count_api_call(method):
+    with _API_CALLS_LOCK:
+        API_CALLS[method] += 1
+
+
+def api_call_counts(reset=False):
+    """
+    Return a dict {method: count} of the Drive API calls made so far.
+    """
+    with _API_CALLS_LOCK:
+        counts = dict(API_CALLS)
+        if reset:
+            API_CALLS.clear()
+    return counts
+
+
+RETRYABLE_HTTP_STATUSES = [429, 500, 502, 503, 504]
+RATE_LIMIT_REASONS = [b'rateLimitExceeded', b'userRateLimitExceeded']
+
+
+def _is_throttled(error):
+    """True if `error` is Drive telling us to slow down (429 or 403 rate limit)."""
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    content = error.content or b''
+    return status == 429 or (status == 403 and any(r in content for r in RATE_LIMIT_REASONS))
+
+
+def _is_retryable(error):
+    if isinstance(error, HttpError):
+        return _is_throttled(error) or error.resp.status in RETRYABLE_HTTP_STATUSES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class DriveThrottle():
+    """
+    Shared limiter for all the Drive API calls made by this process.
+    At most `limit` calls are in flight at once. The limit is halved when Drive
+    responds with rate-limit errors and grows by one after `limit` successful
+    calls in a row (additive increase, multiplicative decrease). Failed calls
+    are retried with jittered exponential backoff.
+    """
+    def __init__(self, initial_concurrency=8, min_concurrency=1, max_concurrency=32,
+                 max_retries=8, base_delay=1.0, max_delay=64.0):
+        self.limit = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.reset_stats()
+        self._active = 0
+        self._successes = 0
+        self._epoch = 0   # incremented on every decrease of the limit
+        self._cond = threading.Condition()
+
+    def reset_stats(self):
+        self.stats = dict(requests=0, throttled=0, retries=0, start=None, end=None)
+
+    def call(self, fn, method):
+        """
+        Call `fn()` (e.g. `request.execute`) once a slot is free, retrying on
+        throttling and transient errors. Counts towards `API_CALLS[method]`.
+        """
+        for attempt in range(self.max_retries + 1):
+            epoch = self._acquire()
+            _count_api_call(method)
+            try:
+                result = fn()
+            except Exception as e:
+                self._release(epoch, throttled=_is_throttled(e), ok=False)
+                if not _is_retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+                with self._cond:
+                    self.stats['retries'] += 1
+                time.sleep(delay)
+                continue
+            self._release(epoch, throttled=False, ok=True)
+            return result
+
+    def _acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+            if self.stats['start'] is None:
+                self.stats['start'] = time.time()
+            return self._epoch
+
+    def _release(self, epoch, throttled, ok):
+        with self._cond:
+            self._active -= 1
+            if ok:
+                self.stats['requests'] += 1
+                self.stats['end'] = time.time()
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            elif throttled:
+                self.stats['throttled'] += 1
+                self._successes = 0
+                # calls in flight when the limit was hit fail together, so only
+                # decrease for calls started since the last decrease
+                if epoch == self._epoch:
+                    self.limit = max(self.min_concurrency, self.limit // 2)
+                    self._epoch += 1
+            self._cond.notify_all()
+
+    def report(self, reset=False):
+        """
+        Return a summary of the calls made, the concurrency limit we settled on,
+        and the effective request rate (successful requests per second) since
+        the last `reset`. The concurrency limit itself is never reset.
+        """
+        with self._cond:
+            stats = dict(self.stats)
+            limit = self.limit
+            if reset:
+                self.reset_stats()
+        elapsed = (stats['end'] - stats['start']) if stats['start'] and stats['end'] else 0
+        rate = stats['requests'] / elapsed if elapsed else 0.0
+        return dict(concurrency=limit, requests=stats['requests'], throttled=stats['throttled'],
+                    retries=stats['retries'], elapsed=elapsed, rate=rate)
+
+
+DRIVE_THROTTLE = DriveThrottle()
 
 
 
@@ -65,8 +268,18 @@ def get_service(service_name=None, service_version=None):
 ################################################################################
 
 FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
-DEFAULT_FILE_FIELDS = 'id,kind,name,mimeType,version,webViewLink,createdTime,modifiedTime'
+DEFAULT_FILE_FIELDS = 'id,kind,name,mimeType,version,webViewLink,createdTime,modifiedTime,size,md5Checksum'
 FORBIDDEN_CHARS_IN_FOLDER_NAMES = ['/', ':']  # will be replaced with underscore
+LIST_BATCH_SIZE = 1   # number of folders listed per files().list call (see itercontents_multi)
+
+
+def _execute(request, method):
+    """
+    Execute the API `request` through the shared `DRIVE_THROTTLE` and count it
+    towards `API_CALLS[method]`.
+    """
+    return DRIVE_THROTTLE.call(request.execute, method)
+
 
 def itercontents(drive, folder_id, order_by='folder,name', file_fields=DEFAULT_FILE_FIELDS):
     """
@@ -81,7 +294,7 @@ def itercontents(drive, folder_id, order_by='folder,name', file_fields=DEFAULT_F
         'fields': fields,
     }
     while True:
-        response = drive.files().list(**params).execute()
+        response = _execute(drive.files().list(**params), 'files.list')
         for file in response['files']:
             yield file
         if 'nextPageToken' in response:
@@ -90,6 +303,38 @@ def itercontents(drive, folder_id, order_by='folder,name', file_fields=DEFAULT_F
             break
 
 
+def itercontents_multi(drive, folder_ids, order_by='folder,name', file_fields=DEFAULT_FILE_FIELDS):
+    """
+    List the contents of several Drive folders with a single OR'ed `parents`
+    query (plus paging), instead of one `itercontents` query per folder.
+    Returns a dict {folder_id: [file, ...]} with the files of each folder in the
+    same order `itercontents` would give them.
+    """
+    if len(folder_ids) == 1:
+        return {folder_ids[0]: list(itercontents(drive, folder_ids[0], order_by, file_fields))}
+    if 'parents' not in file_fields.split(','):
+        file_fields += ',parents'   # needed to split the results back out per folder
+    query = ' or '.join("'" + folder_id + "' in parents" for folder_id in folder_ids)
+    params = {
+        'q': query,
+        'pageToken': None,
+        'orderBy': order_by,
+        'fields': 'nextPageToken, files({})'.format(file_fields),
+    }
+    contents = dict((folder_id, []) for folder_id in folder_ids)
+    while True:
+        response = _execute(drive.files().list(**params), 'files.list')
+        for file in response['files']:
+            for parent_id in file.get('parents', []):
+                if parent_id in contents:
+                    contents[parent_id].append(file)
+        if 'nextPageToken' in response:
+            params['pageToken'] = response['nextPageToken']
+        else:
+            break
+    return contents
+
+
 def list_folder(folder_id):
     """
     Non-recursive list of contents of `folder_id`.
@@ -108,22 +353,50 @@ def _clean_folder_name(name):
     return name
 
 
-def gdrive_walk(folder_id, file_fields=DEFAULT_FILE_FIELDS, drive=None):
+def _thread_drive_getter(drive=None):
+    """
+    Returns a function that gives the Drive service to use in the calling thread.
+    The API client is not thread-safe, so unless a thread-safe `drive` is given
+    (e.g. `fakedrive.FakeDrive`) each worker thread uses its own service from
+    `get_service`.
+    """
+    def get_thread_drive():
+        if drive is not None:
+            return drive
+        return get_service(service_name='drive', service_version='v3')
+
+    return get_thread_drive
+
+
+def gdrive_walk(folder_id, file_fields=DEFAULT_FILE_FIELDS, drive=None, max_workers=None,
+                folder_ids=None, batch_size=LIST_BATCH_SIZE):
     """
     Returns a `os.walk`-like (path, dirs, files) triples for all descendants of
     `folder_id`. Each dict in the list `files` has attributes in `file_fields`.
+    Set `max_workers` > 1 to list folders concurrently from a thread pool, and/or
+    `batch_size` > 1 to list up to that many folders per API call (see
+    `_gdrive_walk_concurrent`); triples are then yielded in completion order.
+    If a dict `folder_ids` is given, it gets filled with {path: id} entries for
+    every folder yielded.
     """
+    shared_drive = drive
     if drive is None:
         drive = get_service(service_name='drive', service_version='v3')
 
     # get the file root
-    root_data = drive.files().get(fileId=folder_id, fields=file_fields).execute()
+    root_data = _execute(drive.files().get(fileId=folder_id, fields=file_fields), 'files.get')
     assert root_data['mimeType'] == FOLDER_MIMETYPE, 'must start walk at folder'
     assert root_data['id'] == folder_id, 'wrong folder returned'
+    root_name = _clean_folder_name(root_data['name'])
+
+    if (max_workers and max_workers > 1) or batch_size > 1:
+        yield from _gdrive_walk_concurrent((root_name,), folder_id, file_fields,
+                                           shared_drive, max_workers or 1, folder_ids,
+                                           batch_size=batch_size)
+        return
 
     # recursively walk tree, keeping track of current position using a stack that
     # stores (path_tuple, folder_id) of next folder to talk
-    root_name = _clean_folder_name(root_data['name'])
     stack = [ ((root_name,), folder_id) ]
     while stack:
         path, folder_id = stack.pop()
@@ -136,29 +409,207 @@ def gdrive_walk(folder_id, file_fields=DEFAULT_FILE_FIELDS, drive=None):
                 stack.append( (item_path, item['id']) )
             else:
                 files.append(item)
+        if folder_ids is not None:
+            folder_ids['/'.join(path)] = folder_id
         yield '/'.join(path), dirnames, files
 
 
-def gdrive_download_file(file_id, destpath, drive=None):
+def _gdrive_walk_concurrent(root_path, folder_id, file_fields, drive, max_workers,
+                            folder_ids=None, batch_size=1):
+    """
+    Breadth-first version of the `gdrive_walk` loop: every folder discovered is
+    submitted to a pool of `max_workers` threads that list it (all pages), so
+    many `files().list` round-trips are in flight at once. Folders discovered
+    together are listed in batches of up to `batch_size` per query using
+    `itercontents_multi`. A folder's triple is always yielded before the
+    triples of its subfolders.
+    """
+    get_thread_drive = _thread_drive_getter(drive)
+
+    def list_folders_contents(batch):
+        contents = itercontents_multi(get_thread_drive(), [fid for _, fid in batch],
+                                      file_fields=file_fields)
+        return [(path, fid, contents[fid]) for path, fid in batch]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        batch = [(root_path, folder_id)]
+        pending = set([executor.submit(list_folders_contents, batch)])
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            triples, discovered = [], []
+            for future in done:
+                for path, folder_id, items in future.result():
+                    dirnames, files = [], []
+                    for item in items:
+                        if item['mimeType'] == FOLDER_MIMETYPE:
+                            dirname = _clean_folder_name(item['name'])
+                            dirnames.append(dirname)
+                            discovered.append((path + (dirname,), item['id']))
+                        else:
+                            files.append(item)
+                    if folder_ids is not None:
+                        folder_ids['/'.join(path)] = folder_id
+                    triples.append(('/'.join(path), dirnames, files))
+            # submit subfolders before yielding so listing continues meanwhile
+            for i in range(0, len(discovered), batch_size):
+                batch = discovered[i:i+batch_size]
+                pending.add(executor.submit(list_folders_contents, batch))
+            for triple in triples:
+                yield triple
+
+
+PARTIAL_DOWNLOAD_EXT = '.part'
+DOWNLOAD_CHUNKSIZE = 10*1024*1024
+DOWNLOAD_WORKERS = 8
+
+
+def _file_digest(path, algorithm='md5'):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024*1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _download_media(request, fh, offset=0, chunksize=None):
+    """
+    Write the data of the `files().get_media` `request` to `fh`, starting at byte
+    `offset`, using one Range request per `chunksize` bytes. Used instead of
+    `MediaIoBaseDownload`, which has no public way to start at an offset.
+    """
+    chunksize = chunksize or DOWNLOAD_CHUNKSIZE
+    total_size = None
+    while total_size is None or offset < total_size:
+        headers = dict(request.headers)
+        headers['range'] = 'bytes={}-{}'.format(offset, offset + chunksize - 1)
+
+        def get_chunk():
+            resp, content = request.http.request(request.uri, headers=headers)
+            if resp.status == 416 and offset == 0:
+                return resp, b''    # empty file
+            if resp.status not in (200, 206):
+                raise HttpError(resp, content, uri=request.uri)
+            return resp, content
+
+        resp, content = DRIVE_THROTTLE.call(get_chunk, 'files.get_media')
+        if resp.status == 200 and offset > 0:
+            fh.seek(0)          # Range was ignored: the body is the whole file
+            fh.truncate()
+            offset = 0
+        fh.write(content)
+        offset += len(content)
+        if 'content-range' in resp and resp.status == 206:
+            total_size = int(resp['content-range'].rsplit('/', 1)[1])
+        else:
+            total_size = offset     # 200 with the whole file, or empty file
+
+
+def gdrive_download_file(file_id, destpath, drive=None, file_info=None):
     """
-    Download the file `file_id` to local path `destdir/destfilename`.
+    Download the file `file_id` to local path `destpath`.
+    Bytes are written to `{destpath}.part`, which is resumed from its last byte
+    if a previous download was interrupted. If `file_info` (the file's dict from
+    `gdrive_walk`) has `size` and `md5Checksum`, the data is verified before it
+    is atomically renamed to `destpath`.
+    Returns `destpath` on success or None if there was an error.
     """
     if drive is None:
         drive = get_service(service_name='drive', service_version='v3')
 
-    request = drive.files().get_media(fileId=file_id)
+    file_info = file_info or {}
+    expected_size = int(file_info['size']) if 'size' in file_info else None
+    expected_md5 = file_info.get('md5Checksum')
+    partpath = destpath + PARTIAL_DOWNLOAD_EXT
+
     try:
-        # print("\tDownloading file - {}".format(destpath))
-        fh = io.FileIO(destpath, mode='wb')
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
+        offset = os.path.getsize(partpath) if os.path.exists(partpath) else 0
+        if expected_size is None or offset > expected_size:
+            offset = 0   # can't resume safely without knowing the final size
+        if expected_size is None or offset < expected_size:
+            # print("\tDownloading file - {}".format(destpath))
+            request = drive.files().get_media(fileId=file_id)
+            with io.FileIO(partpath, mode='ab' if offset else 'wb') as fh:
+                _download_media(request, fh, offset=offset)
+        elif not os.path.exists(partpath):
+            open(partpath, 'wb').close()    # empty file
     except Exception as e:
         print("\tThere was an error while downloding {}".format(file_id))
         print(e)
         return None
 
+    # verify
+    if expected_size is not None and os.path.getsize(partpath) != expected_size:
+        print("\tSize mismatch for {}; discarding partial download".format(destpath))
+        os.remove(partpath)
+        return None
+    if expected_md5 and _file_digest(partpath) != expected_md5:
+        print("\tChecksum mismatch for {}; discarding partial download".format(destpath))
+        os.remove(partpath)
+        return None
+
+    os.replace(partpath, destpath)
+    return destpath
+
+
+def download_files(jobs, drive=None, max_workers=DOWNLOAD_WORKERS):
+    """
+    Download all `(file_info, destpath)` pairs in `jobs` using a pool of
+    `max_workers` threads. Returns the list of `file_info`s that failed.
+    """
+    get_thread_drive = _thread_drive_getter(drive)
+
+    def download_job(job):
+        file_info, destpath = job
+        return gdrive_download_file(file_info['id'], destpath,
+                                    drive=get_thread_drive(), file_info=file_info)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(download_job, job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print('\tError downloading', job[0]['id'], e)
+                result = None
+            if result is None:
+                failed.append(job[0])
+    return failed
+
+
+# CHANGES
+
+CHANGE_FIELDS = 'nextPageToken,newStartPageToken,changes(fileId,removed,file({},parents,trashed))'
+
+def get_start_page_token(drive):
+    """
+    Return the Drive changes feed token for "now", to be saved before a walk.
+    """
+    request = drive.changes().getStartPageToken(supportsAllDrives=True)
+    response = _execute(request, 'changes.getStartPageToken')
+    return response['startPageToken']
+
+
+def list_changes(drive, page_token, file_fields=DEFAULT_FILE_FIELDS):
+    """
+    Return `(changes, new_page_token)` for all changes since `page_token`.
+    """
+    changes = []
+    params = {
+        'pageToken': page_token,
+        'fields': CHANGE_FIELDS.format(file_fields),
+        'includeRemoved': True,
+        'supportsAllDrives': True,
+        'includeItemsFromAllDrives': True,
+    }
+    while True:
+        response = _execute(drive.changes().list(**params), 'changes.list')
+        changes.extend(response['changes'])
+        if 'nextPageToken' in response:
+            params['pageToken'] = response['nextPageToken']
+        else:
+            return changes, response['newStartPageToken']
+
 
 
 # EXPORT
@@ -181,29 +632,269 @@ def get_exported_dir(lang, kind):
     return srcdir
 
 
-def export_folder(folder_id, parentdir='', drive=None):
+# MANIFEST
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_FILE_KEYS = ['name', 'version', 'md5Checksum', 'modifiedTime', 'size']
+
+def load_manifest(lang):
+    """
+    Load the export manifest `chefdata/Exported/{lang}/manifest.json` that records
+    what was downloaded for `lang`:
+        manifest = {
+            'changes_page_token': '1234',                 # Drive changes feed position
+            'folders': {folder_id: relpath, ...},         # relative to Exported/{lang}
+            'files': {
+                file_id: {'path': relpath, 'name': .., 'version': .., 'md5Checksum': ..,
+                          'modifiedTime': .., 'size': ..},
+            },
+        }
+    """
+    manifest_path = os.path.join('chefdata', EXPORTED_DIRNAME, lang, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {'changes_page_token': None, 'folders': {}, 'files': {}}
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(lang, manifest):
+    manifest_path = os.path.join('chefdata', EXPORTED_DIRNAME, lang, MANIFEST_FILENAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def _manifest_entry(file, relpath):
+    entry = {'path': relpath}
+    for key in MANIFEST_FILE_KEYS:
+        entry[key] = file.get(key)
+    return entry
+
+
+def _file_changed(entry, file, relpath, destpath):
+    """
+    True if `file` needs to be (re)downloaded to `destpath` given its manifest `entry`.
+    """
+    if entry is None or not os.path.exists(destpath):
+        return True
+    if entry['path'] != relpath:
+        return True
+    return any(entry.get(key) != file.get(key) for key in MANIFEST_FILE_KEYS)
+
+
+def _moved_unchanged(entry, file, relpath, manifest_root):
+    """
+    True if `file` is the same version as its manifest `entry` but moved to
+    `relpath` (e.g. its folder was renamed), and the old local copy exists.
+    """
+    return (entry is not None and entry['path'] != relpath
+            and all(entry.get(key) == file.get(key) for key in MANIFEST_FILE_KEYS)
+            and os.path.exists(os.path.join(manifest_root, entry['path'])))
+
+
+def export_folder(folder_id, parentdir='', drive=None, max_workers=DOWNLOAD_WORKERS,
+                  manifest=None, manifest_root=None, batch_size=LIST_BATCH_SIZE,
+                  old_entries=None):
+    """
+    Download the contents of the Drive folder `folder_id` to `parentdir` using
+    `max_workers` parallel downloads. Returns the list of files that failed.
+    Without a `manifest`, files already present are skipped; since downloads are
+    moved into place only once complete, a file that exists locally was fully
+    downloaded. With a `manifest` (see `load_manifest`) files are also fetched
+    again when their version or checksum changed, and the manifest's `folders`
+    and `files` entries are updated with paths relative to `manifest_root`.
+    Entries taken out of the manifest can be passed in `old_entries` {id: entry}
+    to be used for the files not in it. Unchanged files that moved are moved
+    locally instead of being downloaded again.
+    """
     if not os.path.exists(parentdir):
         os.makedirs(parentdir)
-    
-    for path, _dirs, files in gdrive_walk(folder_id):
-        destdir = os.path.join(parentdir, path)
-        print('exporting', len(files), 'files to', destdir)
-
-        if not os.path.exists(destdir):
-            os.makedirs(destdir)
-
-        for file in files:
-            file_id = file['id']
-            filaname = file['name']
-            destpath = os.path.join(destdir, filaname)
-            if not os.path.exists(destpath):
-                gdrive_download_file(file_id, destpath, drive=drive)
-            else:
-                pass
-                # print('skipping download of', destpath, 'since it already exists.')
+
+    get_thread_drive = _thread_drive_getter(drive)
+
+    def download_job(file, destpath):
+        return gdrive_download_file(file['id'], destpath, drive=get_thread_drive(), file_info=file)
+
+    folder_ids = {}
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # downloads start while the walk is still listing the remaining folders
+        for path, _dirs, files in gdrive_walk(folder_id, drive=drive, max_workers=max_workers,
+                                              folder_ids=folder_ids, batch_size=batch_size):
+            destdir = os.path.join(parentdir, path)
+            print('exporting', len(files), 'files to', destdir)
+
+            if not os.path.exists(destdir):
+                os.makedirs(destdir)
+
+            for file in files:
+                filaname = file['name']
+                destpath = os.path.join(destdir, filaname)
+                if manifest is None:
+                    needs_download = not os.path.exists(destpath)
+                else:
+                    relpath = os.path.relpath(destpath, manifest_root)
+                    entry = manifest['files'].get(file['id'])
+                    if entry is None and old_entries:
+                        entry = old_entries.get(file['id'])
+                    needs_download = _file_changed(entry, file, relpath, destpath)
+                    if needs_download and _moved_unchanged(entry, file, relpath, manifest_root):
+                        os.replace(os.path.join(manifest_root, entry['path']), destpath)
+                        needs_download = False
+                    if not needs_download:
+                        manifest['files'][file['id']] = _manifest_entry(file, relpath)
+                if needs_download:
+                    futures[executor.submit(download_job, file, destpath)] = (file, destpath)
+                else:
+                    pass
+                    # print('skipping download of', destpath, 'since it already exists.')
+
+    failed = []
+    for future, (file, destpath) in futures.items():
+        try:
+            result = future.result()
+        except Exception as e:
+            print('\tError downloading', file['id'], e)
+            result = None
+        if result is None:
+            failed.append(file)
+        elif manifest is not None:
+            relpath = os.path.relpath(destpath, manifest_root)
+            manifest['files'][file['id']] = _manifest_entry(file, relpath)
+    if manifest is not None:
+        for path, walked_folder_id in folder_ids.items():
+            relpath = os.path.relpath(os.path.join(parentdir, path), manifest_root)
+            manifest['folders'][walked_folder_id] = relpath
+
+    if failed:
+        print('Failed to download', len(failed), 'files from folder', folder_id)
+        for file in failed:
+            print('\t', file['id'], file['name'])
+    return failed
+
+
+def _export_changes(drive, manifest, langdir, max_workers=DOWNLOAD_WORKERS):
+    """
+    Apply the Drive changes since `manifest['changes_page_token']` to the local
+    export in `langdir`: download new or changed files, walk new folders, and
+    return {file_id: entry} for the manifest entries whose files were removed
+    or moved upstream.
+    Changes to files outside the exported folders are ignored.
+    """
+    changes, new_page_token = list_changes(drive, manifest['changes_page_token'])
+    print('Found', len(changes), 'changes since last export')
+    folders, files = manifest['folders'], manifest['files']
+    deleted = {}
+
+    def pop_entries_under(folder_path):
+        """Remove and return the manifest file entries below `folder_path`."""
+        prefix = folder_path + os.sep
+        popped = {fid: e for fid, e in files.items() if e['path'].startswith(prefix)}
+        for fid in popped:
+            del files[fid]
+        for fid, path in list(folders.items()):
+            if path == folder_path or path.startswith(prefix):
+                del folders[fid]
+        return popped
+
+    # 1. removals and new/moved folders
+    changed_files = []
+    failed = []
+    for change in changes:
+        file_id = change['fileId']
+        file = change.get('file')
+        if change.get('removed') or (file and file.get('trashed')):
+            if file_id in files:
+                deleted[file_id] = files.pop(file_id)
+            elif file_id in folders:
+                deleted.update(pop_entries_under(folders[file_id]))
+            continue
+        if file is None:
+            continue
+        parent_ids = [pid for pid in file.get('parents', []) if pid in folders]
+        if not parent_ids:
+            continue
+        if file['mimeType'] == FOLDER_MIMETYPE:
+            parent_path = folders[parent_ids[0]]
+            old_entries = pop_entries_under(folders[file_id]) if file_id in folders else {}
+            folder_failed = export_folder(file_id, parentdir=os.path.join(langdir, parent_path),
+                                          max_workers=max_workers, manifest=manifest,
+                                          manifest_root=langdir, old_entries=old_entries)
+            failed.extend(folder_failed)
+            failed_ids = set(failed_file['id'] for failed_file in folder_failed)
+            for fid, old_entry in old_entries.items():
+                if fid in failed_ids:
+                    files[fid] = old_entry      # the old copy is still there, retried next time
+                elif fid not in files:
+                    deleted[fid] = old_entry    # not in the folder anymore
+                elif files[fid]['path'] != old_entry['path'] \
+                        and os.path.exists(os.path.join(langdir, old_entry['path'])):
+                    deleted[fid] = old_entry    # changed and moved, the old copy is stale
+        else:
+            changed_files.append((file, parent_ids[0]))
+
+    # 2. new/changed files
+    jobs = []
+    for file, parent_id in changed_files:
+        if parent_id not in folders:
+            continue   # its folder was removed by a later change
+        relpath = os.path.join(folders[parent_id], file['name'])
+        destpath = os.path.join(langdir, relpath)
+        entry = files.get(file['id'])
+        if _file_changed(entry, file, relpath, destpath):
+            if entry and entry['path'] != relpath:
+                deleted[file['id']] = entry     # file was moved or renamed
+            os.makedirs(os.path.dirname(destpath), exist_ok=True)
+            jobs.append((file, destpath))
+    failed.extend(download_files(jobs, max_workers=max_workers))
+    failed_ids = set(file['id'] for file in failed)
+    for file, destpath in jobs:
+        if file['id'] not in failed_ids:
+            files[file['id']] = _manifest_entry(file, os.path.relpath(destpath, langdir))
+
+    if failed:
+        # don't advance the changes token, so failed files are retried next time
+        print('Failed to download', len(failed), 'changed files')
+    else:
+        manifest['changes_page_token'] = new_page_token
+    return deleted
+
+
+def report_deletions(deleted, manifest, langdir, prune=False):
+    """
+    Print the files in `deleted` ({file_id: old manifest entry}) that were removed
+    from Drive or moved, and, if `prune` is True, delete the stale local copies
+    from `langdir`. Old paths that now hold a file of the `manifest` (e.g. a new
+    upload with the same name) are left alone.
+    """
+    files = manifest['files']
+    current_paths = set(entry['path'] for entry in files.values())
+    for file_id, entry in deleted.items():
+        if entry['path'] in current_paths:
+            continue
+        localpath = os.path.join(langdir, entry['path'])
+        if file_id in files:
+            print('Moved upstream:', localpath, '->', os.path.join(langdir, files[file_id]['path']))
+        else:
+            print('Deleted upstream:', localpath)
+        if prune and os.path.exists(localpath):
+            os.remove(localpath)
+            print('Pruned stale local copy', localpath)
 
 
-def export(lang='all'):
+def export(lang='all', max_workers=DOWNLOAD_WORKERS, incremental=False, prune=False,
+           batch_size=LIST_BATCH_SIZE, report=True):
+    """
+    Download the courses and activity files for `lang` to `chefdata/Exported/{lang}/`
+    and record them in the export manifest (see `load_manifest`).
+    With `incremental=True` and a changes token saved by a previous export, only
+    the Drive changes since then are fetched instead of walking all folders.
+    Files removed upstream are reported, and deleted locally if `prune=True`.
+    Use `batch_size` > 1 to list several folders per API call.
+    With `report=True` the Drive API and throttle stats are printed (and reset)
+    after each language.
+    """
     from sushichef import HPLIFE_LANGS
     assert lang == 'all' or lang in HPLIFE_LANGS, 'unexpected lang'
     if lang == 'all':
@@ -222,14 +913,54 @@ def export(lang='all'):
         if not os.path.exists(langdir):
             print('Creating export dir parent', langdir)
             os.makedirs(langdir)
+        manifest = load_manifest(lang)
+
+        if incremental and manifest['changes_page_token']:
+            deleted = _export_changes(drive, manifest, langdir, max_workers=max_workers)
+        else:
+            # full export: walk everything, then diff against the previous manifest
+            page_token = get_start_page_token(drive)
+            old_files = manifest['files']
+            manifest['files'], manifest['folders'] = {}, {}
+            failed = []
+
+            # export courses (tar-gzipped XML files stored in a compressed .gz)
+            courses = lang_data_sources['courses']
+            failed += export_folder(courses['folder_id'], parentdir=langdir, max_workers=max_workers,
+                                    manifest=manifest, manifest_root=langdir, batch_size=batch_size,
+                                    old_entries=old_files)
+
+            # export course activity files
+            content = lang_data_sources['activityfiles']
+            failed += export_folder(content['folder_id'], parentdir=langdir, max_workers=max_workers,
+                                    manifest=manifest, manifest_root=langdir, batch_size=batch_size,
+                                    old_entries=old_files)
+
+            for file in failed:
+                if file['id'] in old_files:   # keep old entry so it will be retried
+                    manifest['files'][file['id']] = old_files[file['id']]
+            deleted = {file_id: entry for file_id, entry in old_files.items()
+                       if file_id not in manifest['files']
+                       or manifest['files'][file_id]['path'] != entry['path']}
+            if not failed:
+                manifest['changes_page_token'] = page_token
+
+        report_deletions(deleted, manifest, langdir, prune=prune)
+        save_manifest(lang, manifest)
+        if report:
+            drive_report('lang ' + lang, reset=True)
+
+
+def drive_report(label, reset=False):
+    """
+    Print the Drive API call counts and throttle stats since the last reset.
+    """
+    print('Drive API calls used for', label, api_call_counts(reset=reset))
+    stats = DRIVE_THROTTLE.report(reset=reset)
+    print('Drive throttle settled on concurrency {concurrency} at {rate:.1f} req/s '
+          '({requests} requests, {throttled} throttled, {retries} retries)'.format(**stats))
 
-        # export courses (tar-gzipped XML files stored in a compressed .gz)
-        courses = lang_data_sources['courses']
-        export_folder(courses['folder_id'], parentdir=langdir, drive=drive)
 
-        # export course activity files
-        content = lang_data_sources['activityfiles']
-        export_folder(content['folder_id'], parentdir=langdir, drive=drive)
 
 
 
@@ -242,6 +973,99 @@ def export(lang='all'):
 
 
 
+# STAGING
+################################################################################
+# The rename and extract steps place the exported files in `Renamed/` and then in
+# `Courses/{lang}/{course}/content/`. Instead of copying every byte each time,
+# files can be staged as reflinks (copy-on-write clones), hardlinks, or symlinks.
+# This is safe because later steps never edit staged files in place: downloads
+# replace files with `os.replace`, and the chef transforms copies in `_webroot/`s.
+
+STAGING_MODES = ['copy', 'reflink', 'hardlink', 'symlink', 'auto']
+STAGING_MODE = 'copy'         # 'auto' tries reflink, then hardlink, then copy
+FICLONE = 0x40049409          # Linux ioctl that clones a file's extents (btrfs, xfs)
+
+STAGING_STATS = Counter()
+_STAGING_LOCK = threading.Lock()
+
+
+def _reflink(srcpath, destpath):
+    if fcntl is None:
+        raise OSError('reflinks not supported on this platform')
+    with open(srcpath, 'rb') as src, open(destpath, 'wb') as dest:
+        try:
+            fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dest.close()
+            os.remove(destpath)
+            raise
+
+
+def stage_file(srcpath, destpath, mode=None):
+    """
+    Make the file `srcpath` available at `destpath` using the staging `mode`
+    (defaults to `STAGING_MODE`), falling back to a copy if the filesystem does
+    not support it. Returns the method that was used.
+    """
+    mode = mode or STAGING_MODE
+    assert mode in STAGING_MODES, 'unknown staging mode ' + mode
+    if os.path.lexists(destpath):
+        os.remove(destpath)   # never write through an existing link
+    methods = ['reflink', 'hardlink'] if mode == 'auto' else [mode]
+    used = 'copy'
+    for method in methods:
+        try:
+            if method == 'reflink':
+                _reflink(srcpath, destpath)
+            elif method == 'hardlink':
+                os.link(srcpath, destpath)
+            elif method == 'symlink':
+                os.symlink(os.path.abspath(srcpath), destpath)
+            else:
+                break
+            used = method
+            break
+        except OSError:
+            continue
+    if used == 'copy':
+        shutil.copy(srcpath, destpath)
+    size = os.path.getsize(srcpath)
+    with _STAGING_LOCK:
+        STAGING_STATS[used + '_files'] += 1
+        STAGING_STATS['bytes_copied' if used == 'copy' else 'bytes_saved'] += size
+    return used
+
+
+def stage_tree(srcdir, destdir, mode=None, ignore_patterns=()):
+    """
+    Like `shutil.copytree(srcdir, destdir)` but staging each file with `stage_file`.
+    Files that match any of the glob patterns in `ignore_patterns` are left out.
+    """
+    for root, dirs, files in os.walk(srcdir):
+        reldir = os.path.relpath(root, srcdir)
+        destroot = os.path.normpath(os.path.join(destdir, reldir))
+        os.makedirs(destroot, exist_ok=True)
+        for filename in files:
+            if any(fnmatch.fnmatch(filename, pattern) for pattern in ignore_patterns):
+                continue
+            stage_file(os.path.join(root, filename), os.path.join(destroot, filename), mode=mode)
+
+
+def staging_report(reset=False):
+    """
+    Print and return the number of files staged by each method and the bytes
+    copied vs. saved by linking instead of copying.
+    """
+    with _STAGING_LOCK:
+        stats = dict(STAGING_STATS)
+        if reset:
+            STAGING_STATS.clear()
+    files = ', '.join('{} {}'.format(stats[key], key.replace('_files', ''))
+                      for key in sorted(stats) if key.endswith('_files'))
+    print('Staged files ({}): {:.1f} MB copied, {:.1f} MB saved'.format(
+          files or 'none', stats.get('bytes_copied', 0) / 1e6, stats.get('bytes_saved', 0) / 1e6))
+    return stats
+
 
 
 
@@ -340,8 +1164,8 @@ def rename_courses(lang):
         destpath = os.path.join(destdir, course_name + '.tar.gz')
         #
         # do copy
-        shutil.copy(srcpath, destpath)
-        print('Copied course', filename, 'to', destpath)
+        method = stage_file(srcpath, destpath)
+        print('Staged course', filename, 'to', destpath, '(' + method + ')')
 
 
 def rename_activity_files(lang):
@@ -356,7 +1180,8 @@ def rename_activity_files(lang):
         srcpath = os.path.join(srcdir, filename)
         course_name = _normalize_course_name(filename)
         destpath = os.path.join(destdir, course_name)
-        shutil.copytree(srcpath, destpath)
+        # leave out any partial downloads left by an interrupted export
+        stage_tree(srcpath, destpath, ignore_patterns=['*' + PARTIAL_DOWNLOAD_EXT])
 
 
 
@@ -377,13 +1202,60 @@ FILES_TO_SKIP = [
 ]
 
 
-def extract_courses(lang):
+EXTRACTED_MARKER_FILENAME = '.extracted.json'
+EXTRACT_WORKERS = os.cpu_count()
+
+
+def extract_course_archive(gzpath, destdir):
+    """
+    Untar the course archive `gzpath` into `destdir`, unless the completion marker
+    `{destdir}/.extracted.json` shows this exact archive was already extracted.
+    The archive is unpacked to a temporary dir inside `destdir` and its top-level
+    entries (the `course/` dir) are moved into place before the marker with the
+    archive's sha256 is written, so an interrupted extraction is redone.
+    Returns True if the archive was extracted, False if it was skipped.
+    """
+    archive_hash = _file_digest(gzpath, 'sha256')
+    marker_path = os.path.join(destdir, EXTRACTED_MARKER_FILENAME)
+    if os.path.exists(marker_path):
+        with open(marker_path) as marker_file:
+            marker = json.load(marker_file)
+        if marker.get('sha256') == archive_hash and os.path.exists(os.path.join(destdir, 'course')):
+            return False
+        os.remove(marker_path)
+
+    os.makedirs(destdir, exist_ok=True)
+    tmpdir = tempfile.mkdtemp(dir=destdir, prefix='.extracting-')
+    try:
+        shutil.unpack_archive(gzpath, tmpdir, 'gztar')
+        for name in os.listdir(tmpdir):
+            target = os.path.join(destdir, name)
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            elif os.path.lexists(target):
+                os.remove(target)
+            os.replace(os.path.join(tmpdir, name), target)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    marker = {'archive': os.path.basename(gzpath), 'sha256': archive_hash}
+    with open(marker_path + '.tmp', 'w') as marker_file:
+        json.dump(marker, marker_file, indent=2, ensure_ascii=False)
+    os.replace(marker_path + '.tmp', marker_path)
+    return True
+
+
+def extract_courses(lang, max_workers=EXTRACT_WORKERS, untar=True):
     """
     Extract all the `.gz`s from `chefdata/Renamed/{lang}/{Langname}/{course_name}.gz`
-    to `chefdata/Courses/{lang}/{course_name}/course`.
+    to `chefdata/Courses/{lang}/{course_name}/course` using a pool of `max_workers`
+    processes (see `extract_course_archive`).
+    With `untar=False` the archives are left as they are, since `libedx` can
+    read the course XML straight from them.
     Returns course_names = list of course names encountered.
     """
     course_names = []
+    jobs = []
     # src
     srcdir = get_renamed_dir(lang, 'courses')
     # dest
@@ -398,13 +1270,21 @@ def extract_courses(lang):
             else:
                 print('unexpected filename', filename)
             destdir = os.path.join(extractdir, course_name)
-            if not os.path.exists(os.path.join(destdir, 'course')):
-                print('Untargzipping course', course_name, 'from', gzpath, 'to', destdir)
-                shutil.unpack_archive(gzpath, destdir, 'gztar')
+            jobs.append((course_name, gzpath, destdir))
             course_names.append(course_name)
         else:
             print('skipping non-gz file', filename)
 
+    if not untar:
+        return course_names
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(extract_course_archive, gzpath, destdir)
+                   for _, gzpath, destdir in jobs]
+        for (course_name, gzpath, destdir), future in zip(jobs, futures):
+            if future.result():
+                print('Untargzipped course', course_name, 'from', gzpath, 'to', destdir)
+
     return course_names
 
 
@@ -439,15 +1319,22 @@ def process_content_for_course(lang, course_name):
         # print('          > Processing activity_ref', activity_ref)
         resource_folder = os.path.join(contentdir, activity_ref)
         if not os.path.exists(resource_folder):
-            shutil.copytree(srcpath, resource_folder)
+            stage_tree(srcpath, resource_folder)
         activity_refs.append(activity_ref)
 
     return activity_refs
 
 
-def extract(lang):
+def get_course_archive(lang, course_name):
+    """
+    Path of the renamed course archive `chefdata/Renamed/{lang}/{Language}/{course_name}.tar.gz`.
+    """
+    return os.path.join(get_renamed_dir(lang, 'courses'), course_name + '.tar.gz')
+
+
+def extract(lang, untar=True, report=True):
     print('Extracting lang', lang)
-    course_names = extract_courses(lang)
+    course_names = extract_courses(lang, untar=untar)
     print('\textracting course_names', course_names)
 
     course_list = {
@@ -463,6 +1350,7 @@ def extract(lang):
               "name": course_name,
               "path": course_name,
               "lang": lang,
+              "archive": get_course_archive(lang, course_name),
             }
             course_list['courses'].append(course_info)
 
@@ -473,16 +1361,108 @@ def extract(lang):
     couse_list_path = os.path.join(containerdir, 'course_list.json')
     with open(couse_list_path, 'w') as couse_list_file:
         json.dump(course_list, couse_list_file, indent=4, ensure_ascii=False)
+    if report:
+        staging_report(reset=True)
 
 
 
-# CLI (for testing)
+# PIPELINE
 ################################################################################
 
-if __name__ == '__main__':
-    from sushichef import HPLIFE_LANGS
-    for lang in HPLIFE_LANGS:
-        export(lang=lang)
+NETWORK_SLOTS = 2    # number of languages that can be exporting from Drive at once
+DISK_SLOTS = 2       # number of languages that can be renaming/extracting at once
+
+
+def run_lang_pipeline(lang, network, disk, timings, untar=True, report=True, **export_kwargs):
+    """
+    Run export -> rename_courses -> rename_activity_files -> extract for `lang`.
+    The export step holds one of the `network` semaphore slots and the other
+    steps hold a `disk` slot, so one language can be extracting while another
+    is still downloading. Step durations (without the time spent waiting for a
+    slot) are recorded in `timings[lang]`.
+    """
+    timings[lang] = lang_timings = {}
+    start = time.time()
+    with network:
+        print('[{}] exporting'.format(lang))
+        step_start = time.time()
+        export(lang=lang, report=report, **export_kwargs)
+        lang_timings['export'] = time.time() - step_start
+    with disk:
+        print('[{}] renaming and extracting'.format(lang))
+        step_start = time.time()
         rename_courses(lang=lang)
         rename_activity_files(lang=lang)
-        extract(lang=lang)
+        lang_timings['rename'] = time.time() - step_start
+        step_start = time.time()
+        extract(lang=lang, untar=untar, report=report)
+        lang_timings['extract'] = time.time() - step_start
+    lang_timings['total'] = time.time() - start
+    print('[{}] done in {:.0f}s'.format(lang, lang_timings['total']))
+
+
+def run_pipelines(langs, parallel=False, network_slots=NETWORK_SLOTS, disk_slots=DISK_SLOTS,
+                  **kwargs):
+    """
+    Run the extract pipeline for all `langs`, one after the other or, if
+    `parallel` is True, all at once subject to the shared `network_slots` and
+    `disk_slots` limits. Prints a per-language timing summary at the end.
+    The API call, throttle, and staging counters are shared by all languages,
+    so when run in parallel they are printed once for all languages at the end
+    instead of after each language.
+    """
+    network = threading.BoundedSemaphore(network_slots if parallel else 1)
+    disk = threading.BoundedSemaphore(disk_slots if parallel else 1)
+    timings = {}
+    errors = {}
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=len(langs) if parallel else 1) as executor:
+        futures = {lang: executor.submit(run_lang_pipeline, lang, network, disk, timings,
+                                         report=not parallel, **kwargs)
+                   for lang in langs}
+    for lang, future in futures.items():
+        if future.exception():
+            errors[lang] = future.exception()
+
+    print('\nExtract pipeline summary ({:.0f}s total)'.format(time.time() - start))
+    print('  lang   export   rename  extract    total  status')
+    for lang in langs:
+        lang_timings = timings.get(lang, {})
+        cols = ['{:7.1f}s'.format(lang_timings[step]) if step in lang_timings else '       -'
+                for step in ['export', 'rename', 'extract', 'total']]
+        status = 'ERROR: ' + repr(errors[lang]) if lang in errors else 'ok'
+        print('  {:<5s}'.format(lang), ' '.join(cols), '', status)
+    if parallel:
+        drive_report('all languages', reset=True)
+        staging_report(reset=True)
+    return timings, errors
+
+
+
+# CLI
+################################################################################
+
+if __name__ == '__main__':
+    import argparse
+    from sushichef import HPLIFE_LANGS
+    parser = argparse.ArgumentParser(description='Export, rename, and extract HP LIFE courses.')
+    parser.add_argument('--langs', nargs='+', choices=HPLIFE_LANGS, default=HPLIFE_LANGS)
+    parser.add_argument('--parallel', action='store_true', help='run all languages concurrently')
+    parser.add_argument('--network-slots', type=int, default=NETWORK_SLOTS,
+                        help='languages exporting from Drive at the same time')
+    parser.add_argument('--disk-slots', type=int, default=DISK_SLOTS,
+                        help='languages renaming/extracting at the same time')
+    parser.add_argument('--workers', type=int, default=DOWNLOAD_WORKERS, help='downloads per language')
+    parser.add_argument('--batch-size', type=int, default=LIST_BATCH_SIZE, help='folders per list call')
+    parser.add_argument('--incremental', action='store_true', help='only fetch Drive changes')
+    parser.add_argument('--prune', action='store_true', help='delete files removed from Drive')
+    parser.add_argument('--staging', choices=STAGING_MODES, default=STAGING_MODE)
+    parser.add_argument('--no-untar', action='store_true',
+                        help='leave course archives packed (the chef reads XML from them)')
+    args = parser.parse_args()
+
+    STAGING_MODE = args.staging
+    run_pipelines(args.langs, parallel=args.parallel, network_slots=args.network_slots,
+                  disk_slots=args.disk_slots, max_workers=args.workers,
+                  batch_size=args.batch_size, incremental=args.incremental, prune=args.prune,
+                  untar=not args.no_untar)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+"""
+A local stand-in for the subset of the Google Drive v3 API used in `extract.py`
+(`files.get`, `files.list` with paging, `get_media` with chunked downloads, and
+the changes feed), so the export can be exercised and timed without OAuth or
+network access.
+
+    drive = FakeDrive(make_synthetic_tree(), latency=0.02)
+    for path, dirnames, files in gdrive_walk(root_id, drive=drive):
+        ...
+
+Use `make_fake_data_sources` to seed a backend shaped like `chefdata/data_sources.json`
+and `install_fake_drive` to make `extract.get_service` return it.
+"""
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+
+
+FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
+PARENTS_QUERY_RE = re.compile(r"'([^']+)' in parents")
+RANGE_HEADER_RE = re.compile(r'bytes=(\d+)-(\d+)')
+
+
+
+# FAKE API
+################################################################################
+
+class FakeRequest():
+    """
+    Deferred API call, mimicking `googleapiclient.http.HttpRequest.execute()`.
+    """
+    def __init__(self, drive, method, **kwargs):
+        self.drive = drive
+        self.method = method
+        self.kwargs = kwargs
+
+    def execute(self, num_retries=0):
+        self.drive._simulate_roundtrip(self.method)
+        return getattr(self.drive, '_' + self.method)(**self.kwargs)
+
+
+class FakeResponse(dict):
+    """httplib2-style response: a dict of headers with a `status` attribute."""
+    def __init__(self, status, headers):
+        super().__init__(headers)
+        self.status = status
+
+
+class FakeMediaHttp():
+    """Serves the byte ranges requested by `extract._download_media`."""
+    def __init__(self, drive, file_id):
+        self.drive = drive
+        self.file_id = file_id
+
+    def request(self, uri, method='GET', headers=None, **kwargs):
+        self.drive._simulate_roundtrip('get_media')
+        data = self.drive.contents[self.file_id]
+        match = RANGE_HEADER_RE.match((headers or {}).get('range', ''))
+        if not data:
+            return FakeResponse(416, {'content-range': 'bytes */0'}), b''
+        start, end = (int(match.group(1)), int(match.group(2))) if match else (0, len(data) - 1)
+        chunk = data[start:end+1]
+        content_range = 'bytes {}-{}/{}'.format(start, start + len(chunk) - 1, len(data))
+        return FakeResponse(206, {'content-range': content_range,
+                                  'content-length': str(len(chunk))}), chunk
+
+
+class FakeMediaRequest():
+    """The parts of `HttpRequest` that `extract._download_media` uses."""
+    def __init__(self, drive, file_id):
+        self.uri = 'https://fakedrive.local/files/{}?alt=media'.format(file_id)
+        self.headers = {}
+        self.http = FakeMediaHttp(drive, file_id)
+
+
+class FakeFilesResource():
+    def __init__(self, drive):
+        self.drive = drive
+
+    def get(self, fileId=None, fields=None, **kwargs):
+        return FakeRequest(self.drive, 'get', fileId=fileId, fields=fields)
+
+    def list(self, q=None, pageToken=None, orderBy=None, fields=None, pageSize=100, **kwargs):
+        return FakeRequest(self.drive, 'list', q=q, pageToken=pageToken,
+                           orderBy=orderBy, fields=fields, pageSize=pageSize)
+
+    def get_media(self, fileId=None, **kwargs):
+        if fileId not in self.drive.contents:
+            raise ValueError('No content for file: ' + str(fileId))
+        return FakeMediaRequest(self.drive, fileId)
+
+
+class FakeChangesResource():
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self, **kwargs):
+        return FakeRequest(self.drive, 'get_start_page_token')
+
+    def list(self, pageToken=None, pageSize=100, **kwargs):
+        return FakeRequest(self.drive, 'list_changes', pageToken=pageToken, pageSize=pageSize)
+
+
+class FakeDrive():
+    """
+    In-memory Drive backend. `files` is a dict {id: file_dict} where each
+    file_dict has at least the keys id, name, mimeType, and parents, and
+    `contents` is a dict {id: bytes} for the non-folder files.
+    Every API round-trip sleeps for `latency` seconds and is counted in
+    `self.calls` (thread-safe). Use `update_file` and `remove_file` to record
+    changes that are then reported by the changes feed.
+    """
+    def __init__(self, files, latency=0.0, page_size=100, contents=None):
+        self.files_by_id = files
+        self.contents = contents or {}
+        self.latency = latency
+        self.page_size = page_size
+        self.calls = {}
+        self.change_log = []   # list of (file_id, removed)
+        self._lock = threading.Lock()
+        self._children = {}
+        for file in files.values():
+            for parent_id in file.get('parents', []):
+                self._children.setdefault(parent_id, []).append(file)
+
+    def files(self):
+        return FakeFilesResource(self)
+
+    def changes(self):
+        return FakeChangesResource(self)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = {}
+
+    def _simulate_roundtrip(self, method):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, fileId, fields=None):
+        if fileId not in self.files_by_id:
+            raise ValueError('File not found: ' + str(fileId))
+        return dict(self.files_by_id[fileId])
+
+    def _list(self, q, pageToken=None, orderBy=None, fields=None, pageSize=100):
+        parent_ids = PARENTS_QUERY_RE.findall(q or '')
+        assert parent_ids, 'FakeDrive only supports parents queries'
+        matches = []
+        for parent_id in parent_ids:
+            matches.extend(self._children.get(parent_id, []))
+        # orderBy='folder,name' puts folders first
+        matches.sort(key=lambda f: (f['mimeType'] != FOLDER_MIMETYPE, f['name']))
+        page_size = min(pageSize or self.page_size, self.page_size)
+        start = int(pageToken) if pageToken else 0
+        end = start + page_size
+        response = {'files': [dict(f) for f in matches[start:end]]}
+        if end < len(matches):
+            response['nextPageToken'] = str(end)
+        return response
+
+    # CHANGES
+
+    def _get_start_page_token(self):
+        return {'startPageToken': str(len(self.change_log))}
+
+    def _list_changes(self, pageToken, pageSize=100):
+        start = int(pageToken)
+        end = min(start + pageSize, len(self.change_log))
+        changes = []
+        for file_id, removed in self.change_log[start:end]:
+            change = {'fileId': file_id, 'removed': removed}
+            if not removed:
+                change['file'] = dict(self.files_by_id[file_id])
+            changes.append(change)
+        response = {'changes': changes}
+        if end < len(self.change_log):
+            response['nextPageToken'] = str(end)
+        else:
+            response['newStartPageToken'] = str(end)
+        return response
+
+    def update_file(self, file_id, data):
+        """Replace the contents of `file_id` with `data` and bump its version."""
+        with self._lock:
+            file = self.files_by_id[file_id]
+            self.contents[file_id] = data
+            file.update(_content_fields(data))
+            file['version'] = str(int(file['version']) + 1)
+            self.change_log.append((file_id, False))
+
+    def remove_file(self, file_id):
+        with self._lock:
+            file = self.files_by_id.pop(file_id)
+            self.contents.pop(file_id, None)
+            for parent_id in file.get('parents', []):
+                self._children[parent_id].remove(file)
+            self.change_log.append((file_id, True))
+
+
+
+# SYNTHETIC TREES
+################################################################################
+
+def _content_fields(data):
+    return {'size': str(len(data)), 'md5Checksum': hashlib.md5(data).hexdigest()}
+
+
+class SyntheticTree():
+    """Helper to build the `files` and `contents` dicts for a `FakeDrive`."""
+    def __init__(self):
+        self.ids = ('fake{:06d}'.format(i) for i in itertools.count())
+        self.files = {}
+        self.contents = {}
+
+    def add(self, name, parent_id, is_folder=False, data=None):
+        file_id = next(self.ids)
+        file = {
+            'id': file_id,
+            'kind': 'drive#file',
+            'name': name,
+            'mimeType': FOLDER_MIMETYPE if is_folder else 'application/octet-stream',
+            'version': '1',
+            'webViewLink': 'https://drive.google.com/fake/' + file_id,
+            'createdTime': '2020-01-01T00:00:00.000Z',
+            'modifiedTime': '2020-01-01T00:00:00.000Z',
+            'parents': [parent_id] if parent_id else [],
+        }
+        if not is_folder:
+            data = data if data is not None else (name * 64).encode('utf-8')
+            self.contents[file_id] = data
+            file.update(_content_fields(data))
+        self.files[file_id] = file
+        return file_id
+
+    def add_activity_files(self, parent_id, course_name, activities, subfolders, files_per_folder,
+                           file_size):
+        course_id = self.add(course_name, parent_id, is_folder=True)
+        for a in range(activities):
+            activity_id = self.add('ACT_{}_{} - Storyline output'.format(course_name, a),
+                                   course_id, is_folder=True)
+            self.add('story_html5.html', activity_id)
+            self.add('meta.xml', activity_id)
+            for s in range(subfolders):
+                subfolder_id = self.add('story_content_{}'.format(s), activity_id, is_folder=True)
+                for f in range(files_per_folder):
+                    self.add('file_{}.js'.format(f), subfolder_id, data=os.urandom(file_size))
+
+
+def make_synthetic_tree(root_name='Activity Files', courses=10, activities=3,
+                        subfolders=4, files_per_folder=5, file_size=0):
+    """
+    Build a folder tree shaped like an HP LIFE "Activity Files" export:
+        {root_name}/{course}/{activity} - Storyline output/{subfolder}/{files}
+    Returns `(root_id, files)` where `files` is suitable for `FakeDrive`.
+    """
+    tree = SyntheticTree()
+    root_id = tree.add(root_name, None, is_folder=True)
+    for c in range(courses):
+        tree.add_activity_files(root_id, 'Course {}'.format(c), activities, subfolders,
+                                files_per_folder, file_size)
+    return root_id, tree.files
+
+
+def make_course_archive(course_id, course_name):
+    """
+    Return the bytes of a minimal edX course `.tar.gz` with a `course/` dir.
+    """
+    files = {
+        'course/course.xml': '<course url_name="course" org="HP" course="{}"/>'.format(course_id),
+        'course/course/course.xml': '<course display_name="{}"></course>'.format(course_name),
+        'course/about/overview.html': '<p>{}</p>'.format(course_name),
+    }
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+        for name, text in files.items():
+            data = text.encode('utf-8')
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def make_fake_data_sources(data_sources, courses=5, activities=3, subfolders=4,
+                           files_per_folder=5, file_size=4096):
+    """
+    Seed a synthetic Drive shaped like `data_sources` (the contents of
+    `chefdata/data_sources.json`): for each language a courses folder with one
+    `.tar.gz` per course and an activity files folder with one folder per course.
+    Returns `(fake_data_sources, files, contents)` where `fake_data_sources`
+    has the same structure as `data_sources` but the fake folder ids.
+    """
+    tree = SyntheticTree()
+    fake_data_sources = {}
+    for lang, lang_data_sources in data_sources.items():
+        fake_data_sources[lang] = {}
+        courses_name = lang_data_sources['courses']['name']
+        courses_id = tree.add(courses_name, None, is_folder=True)
+        activityfiles_name = lang_data_sources['activityfiles']['name']
+        activityfiles_id = tree.add(activityfiles_name, None, is_folder=True)
+        for c in range(courses):
+            course_name = 'Course {} {}'.format(lang, c)
+            course_number = 'HPL-{}{:02d}'.format(lang.upper(), c)
+            archive = make_course_archive(course_number.lower(), course_name)
+            tree.add(course_number + ' ' + course_name + '.tar.gz', courses_id, data=archive)
+            tree.add_activity_files(activityfiles_id, course_name, activities, subfolders,
+                                    files_per_folder, file_size)
+        fake_data_sources[lang]['courses'] = {'folder_id': courses_id, 'name': courses_name}
+        fake_data_sources[lang]['activityfiles'] = {'folder_id': activityfiles_id,
+                                                    'name': activityfiles_name}
+    return fake_data_sources, tree.files, tree.contents
+
+
+class FakeServiceFactory():
+    """Drop-in for `extract.SERVICE_FACTORY` that always returns `drive`."""
+    def __init__(self, drive):
+        self.drive = drive
+
+    def get_service(self, service_name, service_version):
+        return self.drive
+
+
+def install_fake_drive(drive):
+    """
+    Make `extract.get_service` return the thread-safe fake `drive` everywhere.
+    """
+    import extract
+    extract.SERVICE_FACTORY = FakeServiceFactory(drive)
+
+
+def write_fake_data_sources(fake_data_sources, path='chefdata/data_sources.json'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as data_sources_file:
+        json.dump(fake_data_sources, data_sources_file, indent=2, ensure_ascii=False)
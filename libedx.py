@@ -1,28 +1,663 @@
 from bs4 import BeautifulSoup
-from bs4.element import NavigableString
-import copy
+from bs4.element import Tag
+from collections import Counter, OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from html.parser import HTMLParser
 import json
+from lxml import etree
 import os
+import pickle
+import tarfile
+import threading
 from urllib.parse import unquote_plus
 
+
+XML_BACKENDS = ['lxml', 'bs4']
+XML_BACKEND = 'lxml'     # 'bs4' is the original BeautifulSoup-based parsing (slower)
+LAZY_HTML_CONTENT = True   # store HTML `content` as LazyHTMLContent instead of str
+LINK_SCANNERS = ['fast', 'html5lib']
+LINK_SCANNER = 'fast'      # 'html5lib' builds a full DOM of every HTML file (slower)
+S3_DOMAIN = 's3.amazonaws.com'
+PARSE_WORKERS = None       # set > 1 to load the files of each tree level with a thread pool
+NODE_MODELS = ['slots', 'dict']
+NODE_MODEL = 'slots'       # 'dict' builds the tree out of plain dicts (more memory)
+
 # HIGH LEVEL API
 ################################################################################
 
-def extract_course_tree(coursedir):
+def extract_course_tree(coursedir, cache=None, max_workers=None):
     """
     Extract a json tree from a edX course 
+    The `coursedir` can be an extracted `course/` directory, a course `.tar.gz`
+    archive, or a `DirSource`/`TarSource` (see `open_course_source`).
+    If a `ParseCache` is given, the result is reused for as long as none of
+    the files read to build it have changed.
+    Use `max_workers` > 1 to load the files in parallel (see `parse_xml_file_refusive`).
     """
-    recusivedata = parse_xml_file_refusive(coursedir, 'course', 'course')
+    if cache is not None:
+        cached = cache.get(str(coursedir))
+        if cached is not None:
+            return cached
+    source = open_course_source(coursedir)
+    recusivedata = parse_xml_file_refusive(source, 'course', 'course', max_workers=max_workers)
     # update root element data course/course.xml with data in basedir course.xml
-    flatdata = parse_xml_file_refusive(coursedir, None, 'course')
+    # (only its attributes are used, so it is parsed without resolving children)
+    flatdata = parse_xml_file(source, None, 'course')
     del flatdata['children']
     recusivedata.update(flatdata)
+    if cache is not None:
+        cache.put(str(coursedir), source.touched_paths(), recusivedata)
     return recusivedata
 
 
 
 
 
+# STATS
+################################################################################
+# Number of files opened on disk, files read (from disk or from a TarSource
+# index), and XML/HTML documents parsed since the last `parse_stats(reset=True)`.
+
+PARSE_STATS = Counter()
+_PARSE_STATS_LOCK = threading.Lock()
+
+def _count(stat):
+    with _PARSE_STATS_LOCK:
+        PARSE_STATS[stat] += 1
+
+
+def parse_stats(reset=False):
+    """
+    Return a dict {stat: count} of the file opens, reads, and parses so far.
+    """
+    with _PARSE_STATS_LOCK:
+        stats = dict(PARSE_STATS)
+        if reset:
+            PARSE_STATS.clear()
+    return stats
+
+
+
+
+# NODES
+################################################################################
+# Tree nodes are dict-like objects that keep the common keys in __slots__ and
+# any other XML attributes or keys added later in a small `extra` dict, which
+# saves a per-node hash table. They support all the usual dict operations
+# (`node['kind']`, `'activity' in node`, `.get()`, `.update()`, `==` dict, ...),
+# but are not `dict` instances: use `json_default` or `to_dict` for JSON.
+# Keys iterate in insertion order, like a dict; the key order tuples are
+# interned so the nodes built the same way share one tuple.
+
+_MISSING = object()
+_KEY_ORDERS = {}
+
+
+def _key_order(keys):
+    return _KEY_ORDERS.setdefault(keys, keys)
+
+
+class Node(MutableMapping):
+    """Base class for tree nodes; subclasses list their slot-backed keys in FIELDS."""
+    __slots__ = ('extra', 'order')
+    FIELDS = ()
+
+    def __init__(self, *args, **kwargs):
+        self.extra = None
+        self.order = ()
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.order = _key_order(self.order + (key,))
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.FIELDS:
+            if getattr(self, key, _MISSING) is _MISSING:
+                raise KeyError(key)
+            delattr(self, key)
+        else:
+            if self.extra is None:
+                raise KeyError(key)
+            del self.extra[key]
+        self.order = _key_order(tuple(k for k in self.order if k != key))
+
+    def __contains__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key, _MISSING) is not _MISSING
+        return self.extra is not None and key in self.extra
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, dict(self))
+
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        self.extra = None
+        self.order = ()
+        self.update(state)
+
+    def to_dict(self):
+        """Return the subtree as plain dicts and lists."""
+        return {key: _to_plain(value) for key, value in self.items()}
+
+
+def _to_plain(value):
+    if isinstance(value, Node):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+class CourseNode(Node):
+    __slots__ = FIELDS = ('kind', 'id', 'display_name', 'url_name', 'children')
+
+class ChapterNode(Node):
+    __slots__ = FIELDS = ('kind', 'id', 'display_name', 'url_name', 'children')
+
+class SequentialNode(Node):
+    __slots__ = FIELDS = ('kind', 'id', 'display_name', 'url_name', 'children')
+
+class VerticalNode(Node):
+    __slots__ = FIELDS = ('kind', 'id', 'display_name', 'url_name', 'children')
+
+class HTMLNode(Node):
+    __slots__ = FIELDS = ('kind', 'url_name', 'content', 'children', 'activity')
+
+class ProblemNode(Node):
+    __slots__ = FIELDS = ('kind', 'children', 'content', 'activity')
+
+class ActivityNode(Node):
+    __slots__ = FIELDS = ('kind', 'story_id', 'bucket_url', 'bucket_path', 'activity_ref',
+                          'entrypoint', 'url')
+
+class GenericNode(Node):
+    """Any other edX element that has children (e.g. a video)."""
+    __slots__ = FIELDS = ('kind', 'id', 'display_name', 'url_name', 'children')
+
+
+NODE_CLASSES = {
+    'course': CourseNode,
+    'chapter': ChapterNode,
+    'sequential': SequentialNode,
+    'vertical': VerticalNode,
+    'html': HTMLNode,
+    'problem': ProblemNode,
+    'hpstoryline': ActivityNode,
+    'articulate_storyline': ActivityNode,
+    'resources_folder': ActivityNode,
+}
+
+
+def make_node(kind, **fields):
+    """
+    Create the node for `kind` with `fields`, or a plain dict if NODE_MODEL is 'dict'.
+    """
+    if NODE_MODEL == 'dict':
+        return dict(kind=kind, **fields)
+    return NODE_CLASSES.get(kind, GenericNode)(kind=kind, **fields)
+
+
+def json_default(obj):
+    """Use as `json.dump(tree, ..., default=json_default)` to serialize course trees."""
+    if isinstance(obj, Node):
+        return dict(obj)
+    return str(obj)     # e.g. LazyHTMLContent
+
+
+def node_from_dict(data):
+    """`json.load` object_hook that turns dicts with a known `kind` back into nodes."""
+    node_class = NODE_CLASSES.get(data.get('kind'))
+    if node_class is None:
+        return data
+    return node_class(data)
+
+
+def dumps_course(tree, **kwargs):
+    return json.dumps(tree, default=json_default, **kwargs)
+
+
+def loads_course(text):
+    return json.loads(text, object_hook=node_from_dict)
+
+
+
+
+# COURSE SOURCES
+################################################################################
+# The parsing functions below read `{kind}/{name}.{ext}` files relative to the
+# root `course/` dir, either from disk or straight from the course archive.
+
+class DirSource():
+    """Course files in an extracted `course/` directory."""
+    def __init__(self, coursedir):
+        self.coursedir = coursedir
+        self.touched = set()     # relpaths read so far
+
+    def path(self, relpath):
+        return os.path.join(self.coursedir, relpath)
+
+    def exists(self, relpath):
+        return os.path.exists(self.path(relpath))
+
+    def read_text(self, relpath):
+        self.touched.add(relpath)
+        _count('opens')
+        _count('reads')
+        with open(self.path(relpath), 'r') as infile:
+            return infile.read()
+
+    def lazy_text(self, relpath, text=None):
+        """
+        Return a `LazyHTMLContent` for the file. Pass in the `text` if it was
+        just read, so the first use of the content doesn't read it again.
+        """
+        path = self.path(relpath)
+        if text is not None:
+            _remember_html_text(path, text)
+        return LazyHTMLContent(path=path)
+
+    def touched_paths(self):
+        """The files on disk that the data read so far depends on."""
+        return [self.path(relpath) for relpath in sorted(self.touched)]
+
+    def __str__(self):
+        return self.coursedir
+
+
+class TarSource():
+    """
+    Course files inside a course archive (`.tar.gz`) or an open tar file object.
+    The XML and HTML files under the archive's `root` dir are read into memory in
+    a single pass, so no files are written to disk and lookups are dict lookups.
+    """
+    INDEXED_EXTS = ('.xml', '.html')
+
+    def __init__(self, archive, root='course'):
+        self.archive = archive if isinstance(archive, str) else getattr(archive, 'name', '<archive>')
+        self.root = root
+        self.files = {}
+        if isinstance(archive, str):
+            tar = tarfile.open(archive, 'r:*')
+        else:
+            tar = tarfile.open(fileobj=archive, mode='r:*')
+        prefix = root + '/'
+        _count('opens')
+        with tar:
+            for member in tar:
+                name = member.name[2:] if member.name.startswith('./') else member.name
+                if member.isfile() and name.startswith(prefix) and name.endswith(self.INDEXED_EXTS):
+                    self.files[name[len(prefix):]] = tar.extractfile(member).read()
+
+    def path(self, relpath):
+        return self.archive + ':' + self.root + '/' + relpath
+
+    def exists(self, relpath):
+        return relpath in self.files
+
+    def read_text(self, relpath):
+        _count('reads')
+        return self.files[relpath].decode('utf-8')
+
+    def lazy_text(self, relpath, text=None):
+        return LazyHTMLContent(data=self.files[relpath])
+
+    def touched_paths(self):
+        """The files on disk that the data read so far depends on."""
+        return [self.archive] if os.path.isfile(self.archive) else []
+
+    def __str__(self):
+        return self.archive + ':' + self.root
+
+
+# The HTML read while parsing (e.g. for the link scan) is kept in a small LRU of
+# HTML_TEXT_CACHE_BYTES, so a LazyHTMLContent used soon after the parse, as the
+# chef does for the course it is building, doesn't read its file a second time.
+HTML_TEXT_CACHE_BYTES = 4*1024*1024     # 0 to disable
+_html_texts = OrderedDict()             # path --> (fingerprint, text)
+_html_texts_size = 0
+_html_texts_lock = threading.Lock()
+
+
+def _remember_html_text(path, text):
+    global _html_texts_size
+    if len(text) > HTML_TEXT_CACHE_BYTES:
+        return
+    fingerprint = file_fingerprint(path)
+    with _html_texts_lock:
+        if path in _html_texts:
+            _html_texts_size -= len(_html_texts.pop(path)[1])
+        _html_texts[path] = (fingerprint, text)
+        _html_texts_size += len(text)
+        while _html_texts_size > HTML_TEXT_CACHE_BYTES:
+            _, (_, old_text) = _html_texts.popitem(last=False)
+            _html_texts_size -= len(old_text)
+
+
+def clear_html_text_cache():
+    global _html_texts_size
+    with _html_texts_lock:
+        _html_texts.clear()
+        _html_texts_size = 0
+
+
+def _recent_html_text(path):
+    """The text of `path` if it was read recently and is unchanged, else None."""
+    with _html_texts_lock:
+        entry = _html_texts.get(path)
+        if entry is None:
+            return None
+        _html_texts.move_to_end(path)
+    fingerprint, text = entry
+    return text if file_fingerprint(path) == fingerprint else None
+
+
+class LazyHTMLContent():
+    """
+    Stand-in for the HTML `content` str of a course tree node that reads the
+    file only when it is used, so the HTML of the whole course is not kept in
+    memory. Use `str(content)` to get the text; BeautifulSoup accepts it as is
+    (it calls `read()`), and slicing, `len`, `in`, and `==` work like for str.
+    For a `TarSource` the node keeps the (encoded) bytes from the archive index.
+    """
+    __slots__ = ('path', 'data')
+
+    def __init__(self, path=None, data=None):
+        self.path = path
+        self.data = data
+
+    def read(self):
+        if self.data is not None:
+            return self.data.decode('utf-8')
+        text = _recent_html_text(self.path)
+        if text is not None:
+            return text
+        _count('opens')
+        _count('reads')
+        with open(self.path, 'r') as infile:
+            text = infile.read()
+        _remember_html_text(self.path, text)
+        return text
+
+    def __str__(self):
+        return self.read()
+
+    def __repr__(self):
+        return '<LazyHTMLContent {}>'.format(self.path or '({} bytes)'.format(len(self.data)))
+
+    def __getitem__(self, key):
+        return self.read()[key]
+
+    def __len__(self):
+        return len(self.read())
+
+    def __contains__(self, substring):
+        return substring in self.read()
+
+    def __eq__(self, other):
+        if isinstance(other, (str, LazyHTMLContent)):
+            return self.read() == str(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.read())
+
+
+def open_course_source(coursedir):
+    """
+    Return a course source for `coursedir`, which can be a path to an extracted
+    `course/` dir, a path to a course archive, or an existing source object.
+    """
+    if isinstance(coursedir, (DirSource, TarSource)):
+        return coursedir
+    if os.path.isfile(coursedir) and tarfile.is_tarfile(coursedir):
+        return TarSource(coursedir)
+    return DirSource(coursedir)
+
+
+def _relpath(kind, name, ext):
+    return kind + '/' + name + '.' + ext if kind else name + '.' + ext
+
+
+
+
+# PARSE CACHE
+################################################################################
+
+PARSE_CACHE_VERSION = 2     # bump when the parsing code changes the output
+
+
+def file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _parse_settings():
+    """The module settings that change the `extract_course_tree` output."""
+    return 'xml={},lazy={},nodes={}'.format(XML_BACKEND, LAZY_HTML_CONTENT, NODE_MODEL)
+
+
+class ParseCache():
+    """
+    On-disk cache of `extract_course_tree` results stored as one pickle per
+    course in `cachedir`. Each entry records the (mtime, size) fingerprints of
+    every file the parse read, and is only used if they are all unchanged.
+    Entries are evicted least-recently-used first once their total size
+    exceeds `max_bytes`. Hits and misses are counted in `self.stats`.
+    """
+    def __init__(self, cachedir, max_bytes=200*1024*1024):
+        self.cachedir = cachedir
+        self.max_bytes = max_bytes
+        self.stats = Counter()
+
+    def _entry_path(self, key):
+        key_str = '{}:{}:{}'.format(PARSE_CACHE_VERSION, _parse_settings(), os.path.abspath(key))
+        return os.path.join(self.cachedir, hashlib.sha1(key_str.encode('utf-8')).hexdigest() + '.pickle')
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as entry_file:
+                entry = pickle.load(entry_file)
+        except FileNotFoundError:
+            self.stats['misses'] += 1
+            return None
+        except Exception:
+            self.stats['misses'] += 1
+            self.stats['corrupt'] += 1
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass    # already removed by another worker
+            return None
+        for path, fingerprint in entry['fingerprints'].items():
+            if file_fingerprint(path) != fingerprint:
+                self.stats['misses'] += 1
+                self.stats['stale'] += 1
+                return None
+        os.utime(entry_path)    # mark as recently used
+        self.stats['hits'] += 1
+        return entry['data']
+
+    def put(self, key, paths, data):
+        if not paths:
+            return   # no files on disk to check later, e.g. a TarSource from a file object
+        entry = {
+            'key': key,
+            'fingerprints': {path: file_fingerprint(path) for path in paths},
+            'data': data,
+        }
+        os.makedirs(self.cachedir, exist_ok=True)
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path + '.{}.tmp'.format(os.getpid())
+        with open(tmp_path, 'wb') as entry_file:
+            pickle.dump(entry, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+        self.stats['writes'] += 1
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for entry in os.scandir(self.cachedir):
+            if entry.name.endswith('.pickle'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue    # evicted by another process
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.stats['evictions'] += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def report(self, reset=False):
+        """
+        Print and return the hit/miss counts since the last reset.
+        """
+        stats = dict(self.stats)
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        if lookups:
+            print('Parse cache: {} hits, {} misses ({} stale), {} writes, {} evictions'.format(
+                  stats.get('hits', 0), stats.get('misses', 0), stats.get('stale', 0),
+                  stats.get('writes', 0), stats.get('evictions', 0)))
+        if reset:
+            self.stats.clear()
+        return stats
+
+
+
+
+# XML BACKENDS
+################################################################################
+# Both backends return the same plain data for the small edX XML files:
+#   - the root element as (name, attrs, children) where children is a list of
+#     (name, attrs) for the child elements, and
+#   - the attrs of the first element with a given name (or None if missing).
+# The lxml parser is configured like the one BeautifulSoup uses for "xml".
+
+def _lxml_parse(xml):
+    parser = etree.XMLParser(recover=True, strip_cdata=False, encoding='utf-8')
+    return etree.fromstring(xml.encode('utf-8'), parser)
+
+
+def _load_xml_root(xml, backend=None):
+    backend = backend or XML_BACKEND
+    _count('xml_parses')
+    if backend == 'lxml':
+        doc_root = _lxml_parse(xml)
+        assert doc_root is not None and doc_root.getprevious() is None \
+            and doc_root.getnext() is None, 'Found more than one root element!'
+        children = [(child.tag, dict(child.attrib)) for child in doc_root
+                    if isinstance(child.tag, str)]   # skip comments and PIs
+        return doc_root.tag, dict(doc_root.attrib), children
+    else:
+        doc = BeautifulSoup(xml, "xml")
+        doc_children = list(doc.children)
+        assert len(doc_children) == 1, 'Found more than one root element!'
+        doc_root = doc_children[0]
+        children = [(child.name, child.attrs) for child in doc_root.children
+                    if isinstance(child, Tag)]           # skip text and comments
+        return doc_root.name, doc_root.attrs, children
+
+
+def _find_xml_tags(xml, names, backend=None):
+    backend = backend or XML_BACKEND
+    _count('xml_parses')
+    if backend == 'lxml':
+        doc_root = _lxml_parse(xml)
+        found = {}
+        for name in names:
+            element = next(doc_root.iter(name), None) if doc_root is not None else None
+            found[name] = dict(element.attrib) if element is not None else None
+        return found
+    else:
+        doc = BeautifulSoup(xml, "xml")
+        found = {}
+        for name in names:
+            tag = doc.find(name)
+            found[name] = tag.attrs if tag is not None else None
+        return found
+
+
+
+
+# LINK SCANNER
+################################################################################
+# Resources-folder detection in `parse_html_file` only needs the attributes of
+# the <a> tags, and only in files that mention S3_DOMAIN. The fast scanner skips
+# all other files and streams the rest through `html.parser` without a DOM.
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            link_attrs = {}
+            for name, value in attrs:
+                link_attrs.setdefault(name, value or '')   # first one wins, as in html5lib
+            self.links.append(link_attrs)
+
+
+def _scan_links(html, scanner=None):
+    """
+    Return the list of attrs dicts of the <a> tags in `html`, or [] if it has
+    no links to S3_DOMAIN when using the fast scanner.
+    """
+    scanner = scanner or LINK_SCANNER
+    if scanner == 'html5lib':
+        _count('html_parses')
+        doc = BeautifulSoup(html, "html5lib")
+        return [link.attrs for link in doc.find_all('a')]
+    else:
+        if S3_DOMAIN not in html:
+            return []
+        _count('html_scans')
+        parser = _LinkParser()
+        parser.feed(html)
+        parser.close()
+        return parser.links
+
+
+
+
 # LOW LEVEL API
 ################################################################################
 # Note: This code has some HP-LIFE specific functions, not general purpose edX
@@ -33,61 +668,54 @@ def parse_xml_file(coursedir, kind, name, ext='xml'):
     and return the json tree representation.
     References are not resolved --- see `parse_xml_file_refusive` for that.
     """
+    source = open_course_source(coursedir)
 
     # Build path to XML file
-    path = coursedir
-    if kind:
-        path = os.path.join(path, kind)
-    path = os.path.join(path, name + '.' + ext)
-    if not os.path.exists(path):
-        raise ValueError('XML file not found: ' + path)
+    relpath = _relpath(kind, name, ext)
+    if not source.exists(relpath):
+        raise ValueError('XML file not found: ' + source.path(relpath))
     
     # Load XML
-    xml = open(path, 'r')
-    doc = BeautifulSoup(xml, "xml")
-    doc_children = list(doc.children)
-    assert len(doc_children) == 1, 'Found more than one root element!'
-    doc_root = doc_children[0]
-    # print(doc)
-    
+    xml = source.read_text(relpath)
+    root_name, root_attrs, children = _load_xml_root(xml)
+
     # JSON data object
-    data = {
-        'kind': doc_root.name,
-        'id': name,
-        'children': [],
-    }
-    data.update(doc_root.attrs)
+    data = make_node(root_name, id=name, children=[])
+    data.update(root_attrs)
     
     # Add children as unresoled references
-    for child in doc_root.children:
-        if type(child) == NavigableString:
-            continue
-        assert len(child.attrs) == 1, 'Assumption failed: encountered more than one attr'
-        kind = child.name
+    for kind, attrs in children:
+        assert len(attrs) == 1, 'Assumption failed: encountered more than one attr'
         child_ref = {
             'kind': kind,
         }
         if kind == 'wiki':
-            child_ref['slug'] = child.attrs['slug']
+            child_ref['slug'] = attrs['slug']
         elif kind == 'html':
-            child_ref['url_name'] = child.attrs['url_name']
+            child_ref['url_name'] = attrs['url_name']
             child_ref['ext'] = 'html'
         else:
-            child_ref['url_name'] = child.attrs['url_name']
+            child_ref['url_name'] = attrs['url_name']
         data['children'].append(child_ref)
 
     return data
 
 
 
-def parse_xml_file_refusive(coursedir, kind, name, ext='xml'):
+def parse_xml_file_refusive(coursedir, kind, name, ext='xml', max_workers=None):
     """
     Parse the XML file at {coursedir}/{kind}/{name}.{ext} recusively
     using the base XML-to-JSON basic parsing function `parse_xml_file`.
     Recusrively resolves all references of the form {kind: AAA, url_name: BBB}
     bu loading the XML data from the file at {coursedir}/AAA/BBB.xml
+    With `max_workers` > 1 (default `PARSE_WORKERS`) the references are resolved
+    level by level using a thread pool (see `_parse_xml_file_levels`).
     Returns a json tree representation.
     """
+    coursedir = open_course_source(coursedir)
+    max_workers = max_workers or PARSE_WORKERS
+    if max_workers and max_workers > 1:
+        return _parse_xml_file_levels(coursedir, kind, name, ext, max_workers)
     root = parse_xml_file(coursedir, kind, name, ext=ext)
     new_children = []
     for child in root['children']:
@@ -109,6 +737,50 @@ def parse_xml_file_refusive(coursedir, kind, name, ext='xml'):
     return root
 
 
+def _resolve_child_ref(source, child):
+    """
+    Load the data for the child reference `child` (one level only).
+    Returns `(data, is_container)` where `data` is None for skipped problems and
+    `is_container` is True if `data['children']` are unresolved references.
+    """
+    child_kind = child['kind']
+    if child_kind == 'wiki':
+        return child, False
+    elif child_kind == 'html':
+        return parse_html_file(source, child_kind, child['url_name'], ext='html'), False
+    elif child_kind == 'problem':
+        return parse_problem_file(source, child_kind, child['url_name'], ext='xml'), False
+    else:
+        return parse_xml_file(source, child_kind, child['url_name'], ext='xml'), True
+
+
+def _parse_xml_file_levels(source, kind, name, ext, max_workers):
+    """
+    Same result as the serial `parse_xml_file_refusive`, but all the references
+    of one tree level are loaded at once by `max_workers` threads. `executor.map`
+    returns the results in submission order, so each node gets its children back
+    in the original order. Only the nodes of the current level are held besides
+    the tree itself.
+    """
+    root = parse_xml_file(source, kind, name, ext=ext)
+    level = [root]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while level:
+            refs = [(node, child) for node in level for child in node['children']]
+            results = executor.map(lambda ref: _resolve_child_ref(source, ref[1]), refs)
+            for node in level:
+                node['children'] = []
+            next_level = []
+            for (node, _), (data, is_container) in zip(refs, results):
+                if not data:
+                    continue   # skip problems of unexpected type, like the serial version
+                node['children'].append(data)
+                if is_container:
+                    next_level.append(data)
+            level = next_level
+    return root
+
+
 
 
 def parse_html_file(coursedir, kind, name, ext='html'):
@@ -116,24 +788,20 @@ def parse_html_file(coursedir, kind, name, ext='html'):
     Parse the HTML file at {coursedir}/{kind}/{name}.{ext}
     and return the json tree representation.
     """
+    source = open_course_source(coursedir)
+
     # Build path to XML file
-    path = coursedir
-    if kind:
-        path = os.path.join(path, kind)
-    path = os.path.join(path, name + '.' + ext)
-    if not os.path.exists(path):
-        raise ValueError('HTML file not found: ' + path)
+    relpath = _relpath(kind, name, ext)
+    if not source.exists(relpath):
+        raise ValueError('HTML file not found: ' + source.path(relpath))
     
     # Load XML
-    html = open(path, 'r').read()
+    html = source.read_text(relpath)
     
     # JSON data object
-    data = {
-        'kind': kind,
-        'url_name': name,
-        'content': html,                 # [0:30] + '...',  # used for debugging
-        'children': [],
-    }
+    data = make_node(kind, url_name=name,
+                     content=source.lazy_text(relpath, html) if LAZY_HTML_CONTENT else html,
+                     children=[])
 
     # Hanlde special case of HTML file with downloadable resources
 
@@ -141,10 +809,9 @@ def parse_html_file(coursedir, kind, name, ext='html'):
     seen_tuple = None                           # save (bucket_url, bucket_path, activity_ref) links seen
     is_resources_folder = False                 # True if all links are to the same seen_tuple
 
-    doc = BeautifulSoup(html, "html5lib")
-    links = doc.find_all('a')
+    links = _scan_links(html)
     for link in links:
-        if 'href' in link.attrs and 's3.amazonaws.com' in link['href']:
+        if 'href' in link and S3_DOMAIN in link['href']:
             is_resources_folder_candidate = True
             # print('Found resources_folder_candidate')
         else:
@@ -152,7 +819,7 @@ def parse_html_file(coursedir, kind, name, ext='html'):
             pass
 
         if is_resources_folder_candidate:
-            if 'href' in link.attrs and 's3.amazonaws.com' in link['href']:
+            if 'href' in link and S3_DOMAIN in link['href']:
                 url_parts = link['href'].split('/')
                 bucket_url = '/'.join(url_parts[0:4])
                 bucket_path = '/'.join(url_parts[4:-2])
@@ -170,8 +837,8 @@ def parse_html_file(coursedir, kind, name, ext='html'):
                 pass
 
     if is_resources_folder:
-        data['activity'] = dict(
-            kind = 'resources_folder',
+        data['activity'] = make_node(
+            'resources_folder',
             bucket_url = seen_tuple[0],
             bucket_path = seen_tuple[1],
             activity_ref = seen_tuple[2],
@@ -187,41 +854,38 @@ def parse_problem_file(coursedir, kind, name, ext='xml'):
     Parse the XML for an Articulate Storyline file at {coursedir}/{kind}/{name}.{ext}
     and return the json tree representation.
     """
+    source = open_course_source(coursedir)
+
     # Build path to XML file
-    path = coursedir
-    if kind:
-        path = os.path.join(path, kind)
-    path = os.path.join(path, name + '.' + ext)
-    if not os.path.exists(path):
+    relpath = _relpath(kind, name, ext)
+    path = source.path(relpath)
+    if not source.exists(relpath):
         raise ValueError('HTML file not found: ' + path)
     
     # Load XML
-    xml = open(path, 'r').read()
-    doc = BeautifulSoup(xml, "xml")
+    xml = source.read_text(relpath)
+    found = _find_xml_tags(xml, ['choiceresponse', 'jsinput'])
 
     # JSON data object
-    data = {
-        'kind': kind,
-        'children': [],
-    }
+    data = make_node(kind, children=[])
 
-    choiceresponse = doc.find('choiceresponse')
-    jsinput = doc.find('jsinput')
+    choiceresponse = found['choiceresponse']
+    jsinput = found['jsinput']
 
     # CASE A: non-articulare choiceresponse activity
-    if choiceresponse and jsinput is None:
+    if choiceresponse is not None and jsinput is None:
         data['content'] = xml
 
     # CASE B: activity files
-    elif jsinput and choiceresponse is None:
+    elif jsinput is not None and choiceresponse is None:
         url = jsinput['html_file']
 
         # old-style hpstoryline
         if 'hpstoryline.edcastcloud.com' in url or 'herokuapp.com/hp_storyline' in url:
             querystring = url.split('?')[1]
             story_id = querystring.replace('story=', '')
-            data['activity'] = dict(
-                kind = 'hpstoryline',
+            data['activity'] = make_node(
+                'hpstoryline',
                 story_id = story_id,
                 url=url,
             )
@@ -229,8 +893,8 @@ def parse_problem_file(coursedir, kind, name, ext='xml'):
         # new-style articulare storyline
         else:
             url_parts = url.split('/')
-            data['activity'] = dict(
-                kind = 'articulate_storyline',
+            data['activity'] = make_node(
+                'articulate_storyline',
                 bucket_url = '/'.join(url_parts[0:4]),
                 bucket_path = '/'.join(url_parts[4:-2]),
                 activity_ref = unquote_plus(url_parts[-2]),
@@ -260,9 +924,8 @@ def print_course(course):
         if 'slug' in subtree:
             extra += ' slug=' + subtree['slug']
         if subtree['kind'] == 'course':
-            subtreecopy = copy.deepcopy(subtree)
-            del subtreecopy['children']
-            extra += ' attrs='+str(subtreecopy)
+            attrs = {key: value for key, value in subtree.items() if key != 'children'}
+            extra += ' attrs='+str(attrs)
         if 'activity' in subtree:
             if subtree['activity']['kind'] == 'hpstoryline':
                 extra += 'story_id=' + str(subtree['activity']['story_id'])
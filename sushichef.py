@@ -1,7 +1,16 @@
 #!/usr/bin/env python
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import difflib
+import hashlib
 import json
+from multiprocessing import Pool
 import os
 import requests
+import shutil
+import sys
+import tempfile
+import time
 
 
 from le_utils.constants import content_kinds, file_types, licenses
@@ -11,6 +20,11 @@ from ricecooker.utils.jsontrees import write_tree_to_json_tree
 
 
 from libedx import extract_course_tree
+from libedx import file_fingerprint
+from libedx import ParseCache
+from libedx import PARSE_STATS
+from libedx import json_default
+from libedx import parse_stats
 from libedx import print_course
 
 from transform import download_hpstoryline
@@ -19,6 +33,7 @@ from transform import extract_course_resouces
 from transform import get_activity_descriptions_from_coursestart_html
 from transform import get_course_description_from_coursestart_html
 from transform import make_html5zip_from_resources
+from transform import set_http_cache_update
 from transform import transform_html
 from transform import transform_hpstoryline_folder
 from transform import transform_articulate_storyline_folder
@@ -28,6 +43,14 @@ DEBUG_MODE = False
 
 COURSES_DIR = 'chefdata/Courses'
 
+PARSE_CACHE_DIR = 'chefdata/cache/course_trees'
+PARSE_CACHE = ParseCache(PARSE_CACHE_DIR)   # set to None to always re-parse the course XML
+
+SUBTREE_CACHE_DIR = 'chefdata/cache/course_subtrees'   # see SubtreeCache, set SUBTREE_CACHE = None to disable
+
+BUILD_WORKERS = 1             # processes used to build the courses, set with workers=N
+BUILD_MAXTASKSPERCHILD = 0    # courses per worker process before it's replaced (0 = never)
+
 HPLIFE_LICENSE = get_license(licenses.CC_BY, copyright_holder='HP LIFE').as_dict()
 
 HPLIFE_LANGS = ['es', 'fr', 'en', 'ar', 'hi', 'pt', 'zh']
@@ -200,40 +223,82 @@ CONTENT_FOLDER_RENAMES = {
     },
 }
 
-def find_activity_ref(contentdir, activity_ref):
+def _is_candidate_folder(folder):
+    return not (any(folder.startswith(p) for p in NON_RESOURCE_FOLDER_PREFIXES) or folder.endswith('_webroot'))
+
+
+class ContentIndex():
+    """
+    Index of the folders in the `contentdir` of a course, built with one
+    `os.scandir` of content/ and of its candidate folders (the ones that can
+    contain activity folders). Maps each name to its paths relative to
+    `contentdir`, top-level first, so activity_ref lookups need no more I/O.
+    Names found in more than one place are recorded in `self.ambiguous`.
+    """
+    def __init__(self, contentdir):
+        self.contentdir = contentdir
+        self.paths = {}         # name --> [relpath, ...]
+        self.ambiguous = {}     # activity_ref --> [relpath, ...] for refs found more than once
+        with os.scandir(contentdir) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        self.candidate_folders = [entry.name for entry in entries
+                                  if _is_candidate_folder(entry.name) and entry.is_dir()]
+        for entry in entries:
+            self.paths.setdefault(entry.name, []).append(entry.name)
+        for folder in self.candidate_folders:
+            with os.scandir(os.path.join(contentdir, folder)) as subentries:
+                for name in sorted(subentry.name for subentry in subentries):
+                    self.paths.setdefault(name, []).append(os.path.join(folder, name))
+
+    def find(self, activity_ref):
+        """
+        Return the path of `activity_ref` relative to `contentdir`, or None.
+        """
+        if os.sep in activity_ref:  # already a relative path
+            return activity_ref if os.path.exists(os.path.join(self.contentdir, activity_ref)) else None
+        relpaths = self.paths.get(activity_ref)
+        if not relpaths:
+            return None
+        if len(relpaths) > 1:
+            self.ambiguous[activity_ref] = relpaths
+        return relpaths[0]
+
+    def near_misses(self, activity_ref, n=3, cutoff=0.6):
+        """
+        Return the relative paths of the folders whose names are close to the
+        missing `activity_ref`, to help fill in CONTENT_FOLDER_RENAMES.
+        """
+        names = [name for name in self.paths if _is_candidate_folder(name)]
+        matches = difflib.get_close_matches(os.path.basename(activity_ref), names, n=n, cutoff=cutoff)
+        return [relpath for name in matches for relpath in self.paths[name]]
+
+
+def find_activity_ref(contentdir, activity_ref, content_index=None):
     """
     Look for the resource folder called `activity_ref` in content/ and subdirs.
+    Pass in a `ContentIndex` of `contentdir` when looking up several refs.
     Return None if not found.
     """
-    activity_ref_sourcedir = os.path.join(contentdir, activity_ref)
-    if os.path.exists(activity_ref_sourcedir):
-        return activity_ref_sourcedir
-    else:
-        folders = os.listdir(contentdir)
-        candidate_folders = []
-        for folder in folders:
-            if any(folder.startswith(p) for p in NON_RESOURCE_FOLDER_PREFIXES) or folder.endswith('_webroot'):
-                continue
-            candidate_folders.append(folder)
-        for candidate_folder in candidate_folders:
-            activity_ref_sourcedir = os.path.join(contentdir, candidate_folder, activity_ref)
-            if os.path.exists(activity_ref_sourcedir):
-                return activity_ref_sourcedir
-    return None
+    if content_index is None:
+        content_index = ContentIndex(contentdir)
+    relpath = content_index.find(activity_ref)
+    if relpath is None:
+        return None
+    return os.path.join(contentdir, relpath)
 
 
 
-def tranform_and_prevalidate(course_data, lang, coursedir, contentdir):
+def check_activity_refs(course_data, parsed_tree, contentdir, download=True, content_index=None):
     """
-    Performs necessary checks to know we have a valid course:
-      - Exports the hpstyryline legacy files by running `download_hpstoryline`
-      - Rename non-standard articulate storyline folder names
-      - Ensure all activity files are present
-    Returns validated, modified `course_data` dict or `None` if validation fails.
+    Check the activity folders of the story, businessconcept, and technologyskill
+    items are present in `contentdir`, renaming non-standard articulate storyline
+    folder refs in the items. Missing hpstoryline folders are downloaded unless
+    `download` is False. Returns `(missing_activity_refs, missing_story_ids)`.
     """
-
-    parsed_tree = parse_course_tree(course_data, lang)
+    if content_index is None:
+        content_index = ContentIndex(contentdir)
     missing_activity_refs = []
+    missing_story_ids = []
     for key in ['story', 'businessconcept', 'technologyskill']:
         item = parsed_tree[key]
         kind = item['kind']
@@ -244,7 +309,11 @@ def tranform_and_prevalidate(course_data, lang, coursedir, contentdir):
             story_id = item['activity']['story_id']
             contentdir_story_id_path = os.path.join(contentdir, story_id)
             if not os.path.exists(contentdir_story_id_path):
-                download_hpstoryline(contentdir, story_id)
+                if download:
+                    download_hpstoryline(contentdir, story_id)
+                else:
+                    missing_story_ids.append(story_id)
+                    continue
             assert os.path.exists(contentdir_story_id_path)
 
         # New-style Articulate Storyline
@@ -258,31 +327,47 @@ def tranform_and_prevalidate(course_data, lang, coursedir, contentdir):
                 activity_ref = CONTENT_FOLDER_RENAMES[course_id][key][activity_ref]
                 item['activity']['activity_ref'] = activity_ref
 
-            activity_ref_sourcedir = find_activity_ref(contentdir, activity_ref)
-            if activity_ref_sourcedir is None:
+            activity_ref_rel_path = content_index.find(activity_ref)
+            if activity_ref_rel_path is None:
                 missing_activity_refs.append(activity_ref)
-            else:
-                activity_ref_sourcedir_rel_path = activity_ref_sourcedir.replace(contentdir, '')[1:]
-                if activity_ref_sourcedir_rel_path != activity_ref:
-                    # print('rewriting activity_ref', activity_ref, 'to', activity_ref_sourcedir_rel_path)
-                    item['activity']['activity_ref'] = activity_ref_sourcedir_rel_path
+            elif activity_ref_rel_path != activity_ref:
+                # print('rewriting activity_ref', activity_ref, 'to', activity_ref_rel_path)
+                item['activity']['activity_ref'] = activity_ref_rel_path
 
         else:
             print('EEEEE Unrecognized problem item', item)
 
+    for activity_ref, relpaths in content_index.ambiguous.items():
+        print('WARNING: activity folder', activity_ref, 'found in', relpaths, 'using', relpaths[0])
+    return missing_activity_refs, missing_story_ids
+
+
+def tranform_and_prevalidate(course_data, lang, coursedir, contentdir, parsed_tree=None):
+    """
+    Performs necessary checks to know we have a valid course:
+      - Exports the hpstyryline legacy files by running `download_hpstoryline`
+      - Rename non-standard articulate storyline folder names
+      - Ensure all activity files are present
+    Pass in the `parsed_tree` from `load_course` to avoid parsing the tree again.
+    Returns validated, modified `course_data` dict or `None` if validation fails.
+    """
+    if parsed_tree is None:
+        parsed_tree = parse_course_tree(course_data, lang)
+    content_index = ContentIndex(contentdir)
+    missing_activity_refs, _ = check_activity_refs(course_data, parsed_tree, contentdir,
+                                                   content_index=content_index)
+
     if not missing_activity_refs:
         return course_data
     else:
         print('in course name', course_data['display_name'], 'with course id', course_data['course'])
         print('in coursedir', coursedir)
         print('we\'re missing activity folders', missing_activity_refs)
-        folders = os.listdir(contentdir)
-        candidate_folders = []
-        for folder in folders:
-            if any(folder.startswith(p) for p in NON_RESOURCE_FOLDER_PREFIXES) or folder.endswith('_webroot'):
-                continue
-            candidate_folders.append(folder)
-        print('available', candidate_folders)
+        print('available', content_index.candidate_folders)
+        for activity_ref in missing_activity_refs:
+            near_misses = content_index.near_misses(activity_ref)
+            if near_misses:
+                print('similar folders for', activity_ref, '(see CONTENT_FOLDER_RENAMES):', near_misses)
         return None
 
 
@@ -418,6 +503,30 @@ def parse_course_tree(course_data, lang):
     return parsed_tree
 
 
+def get_course_dirs(course, containerdir):
+    """
+    Return `(coursedir, contentdir)` for a `course` entry of `course_list.json`.
+    The `coursedir` is the course archive if the course was not untarred.
+    """
+    basedir = os.path.join(containerdir, course['path'])
+    contentdir = os.path.join(basedir, 'content')
+    coursedir = os.path.join(basedir, 'course')
+    if not os.path.exists(coursedir) and 'archive' in course:
+        coursedir = course['archive']   # course XML is read straight from the .tar.gz
+    return coursedir, contentdir
+
+
+def load_course(coursedir, lang):
+    """
+    Read the edX XML of a course once and return `(course_data, parsed_tree)`:
+    the json tree from `extract_course_tree` and the `parsed_tree` from
+    `parse_course_tree`, whose items are nodes of `course_data`.
+    """
+    course_data = extract_course_tree(coursedir, cache=PARSE_CACHE)
+    parsed_tree = parse_course_tree(course_data, lang)
+    return course_data, parsed_tree
+
+
 
 
 def process_course_tree(parsed_tree, lang, contentdir, course_id, chefargs=None):
@@ -466,6 +575,154 @@ def process_course_tree(parsed_tree, lang, contentdir, course_id, chefargs=None)
 
 
 
+# SUBTREE CACHE
+################################################################################
+# The course subtree returned by `build_subtree_from_course` is saved per course
+# with a fingerprint of everything it was built from: the course XML, the files
+# in content/ (including the downloads and conversions of the build itself), the
+# constants below, and the code of the chef. A course is rebuilt only if one of
+# them changed, or if one of the files its subtree points to is gone.
+
+SUBTREE_CACHE_CODE_FILES = ['sushichef.py', 'transform.py', 'libedx.py']
+
+
+def _tree_fingerprint(path):
+    """
+    Return a digest of the (relpath, mtime, size) of all files under `path`,
+    or the fingerprint of `path` itself if it is a file (e.g. a course archive).
+    """
+    if not os.path.isdir(path):
+        return file_fingerprint(path)
+    digest = hashlib.sha1()
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            filepath = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(filepath, path)
+            digest.update('{}:{}\n'.format(relpath, file_fingerprint(filepath)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _code_version():
+    digest = hashlib.sha1()
+    basedir = os.path.dirname(os.path.abspath(__file__))
+    for filename in SUBTREE_CACHE_CODE_FILES:
+        with open(os.path.join(basedir, filename), 'rb') as code_file:
+            digest.update(code_file.read())
+    return digest.hexdigest()
+
+
+def _iter_subtree_paths(node):
+    """Yield the local file paths the ricecooker json `node` points to."""
+    if node.get('thumbnail'):
+        yield node['thumbnail']
+    for file_dict in node.get('files', []):
+        if 'path' in file_dict:
+            yield file_dict['path']
+    for child in node.get('children', []):
+        yield from _iter_subtree_paths(child)
+
+
+class SubtreeCache():
+    """
+    On-disk cache of the course subtrees built by `build_subtree_from_course`,
+    stored as one json file per course in `cachedir`. Zip files the build left
+    in the system temp dir are moved to `cachedir/zips` so the cached subtrees
+    keep pointing to them. Hits and misses are counted in `self.stats`.
+    """
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        self.zipsdir = os.path.join(cachedir, 'zips')
+        self.stats = Counter()
+        self._code_version = None
+
+    def _entry_path(self, course, containerdir):
+        key = os.path.abspath(os.path.join(containerdir, course['path']))
+        return os.path.join(self.cachedir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def fingerprint(self, course, containerdir):
+        if self._code_version is None:
+            self._code_version = _code_version()
+        coursedir, contentdir = get_course_dirs(course, containerdir)
+        fingerprint = {
+            'code': self._code_version,
+            'course': course,
+            'coursedir': _tree_fingerprint(coursedir),
+            'contentdir': _tree_fingerprint(contentdir),
+            'renames': CONTENT_FOLDER_RENAMES,
+            'strings': HPLIFE_STRINGS.get(course['lang']),
+            'skip': COUSE_SOURCE_IDS_SKIP_LIST,
+        }
+        return hashlib.sha1(json.dumps(fingerprint, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, course, containerdir):
+        try:
+            with open(self._entry_path(course, containerdir)) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            self.stats['misses'] += 1
+            return None
+        if entry['fingerprint'] != self.fingerprint(course, containerdir) \
+                or not all(os.path.exists(path) for path in _iter_subtree_paths(entry['course_dict'])):
+            self.stats['misses'] += 1
+            self.stats['stale'] += 1
+            return None
+        self.stats['hits'] += 1
+        return entry['course_dict']
+
+    def _keep_zip(self, path):
+        """Move a zip file out of the system temp dir and return its new path."""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(tempfile.gettempdir()):
+            return path
+        os.makedirs(self.zipsdir, exist_ok=True)
+        with open(path, 'rb') as zip_file:
+            md5 = hashlib.md5(zip_file.read()).hexdigest()
+        keptpath = os.path.join(self.zipsdir, md5 + os.path.splitext(path)[1])
+        shutil.move(path, keptpath)
+        return keptpath
+
+    def put(self, course, containerdir, course_dict):
+        """
+        Save the `course_dict` subtree, pointing it to the kept zip files.
+        The fingerprint is taken after the build so it includes its downloads.
+        """
+        nodes = [course_dict]
+        while nodes:
+            node = nodes.pop()
+            for file_dict in node.get('files', []):
+                if file_dict.get('path', '').endswith('.zip'):
+                    file_dict['path'] = self._keep_zip(file_dict['path'])
+            nodes.extend(node.get('children', []))
+        entry = {
+            'fingerprint': self.fingerprint(course, containerdir),
+            'course_dict': course_dict,
+        }
+        os.makedirs(self.cachedir, exist_ok=True)
+        entry_path = self._entry_path(course, containerdir)
+        tmp_path = entry_path + '.{}.tmp'.format(os.getpid())
+        with open(tmp_path, 'w') as entry_file:
+            json.dump(entry, entry_file, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+        self.stats['writes'] += 1
+
+    def report(self, reset=False):
+        """
+        Print and return the hit/miss counts since the last reset.
+        """
+        stats = dict(self.stats)
+        if stats.get('hits', 0) + stats.get('misses', 0):
+            print('Subtree cache: {} courses reused, {} rebuilt ({} changed)'.format(
+                  stats.get('hits', 0), stats.get('misses', 0), stats.get('stale', 0)))
+        if reset:
+            self.stats.clear()
+        return stats
+
+
+SUBTREE_CACHE = SubtreeCache(SUBTREE_CACHE_DIR)
+
+
+
+
 # BUILD RICECOOKER TREE
 ################################################################################
 
@@ -479,13 +736,12 @@ def build_subtree_from_course(course, containerdir, chefargs=None):
         thumbnail='chefdata/thumbnails/new_channel_thumbnail.png',
         children = [],
     )
-    basedir = os.path.join(containerdir, course['path'])
-    contentdir = os.path.join(basedir, 'content')
-    coursedir = os.path.join(basedir, 'course')
-    course_data = extract_course_tree(coursedir)
+    coursedir, contentdir = get_course_dirs(course, containerdir)
+    course_data, parsed_tree = load_course(coursedir, lang)
     course_dict['source_id'] = course_data['course']
 
-    course_data = tranform_and_prevalidate(course_data, lang, coursedir, contentdir)
+    course_data = tranform_and_prevalidate(course_data, lang, coursedir, contentdir,
+                                           parsed_tree=parsed_tree)
     if course_data is None:
         print("ERROR: Skipping", course_dict['source_id'], course['name'], "because failed tranform_and_prevalidate")
         return None
@@ -494,9 +750,8 @@ def build_subtree_from_course(course, containerdir, chefargs=None):
         # print_course(course_data)
         course_tree_path = 'chefdata/course_trees/course_tree-{}.json'.format(course_dict['source_id'])
         with open(course_tree_path, 'w') as json_file:
-            json.dump(course_data, json_file, indent=4, ensure_ascii=False)
+            json.dump(course_data, json_file, indent=4, ensure_ascii=False, default=json_default)
 
-    parsed_tree = parse_course_tree(course_data, lang)
     parsed_tree = process_course_tree(parsed_tree, lang, contentdir, course_data['course'], chefargs=chefargs)
     course_dict['description'] = parsed_tree['description']
 
@@ -685,6 +940,266 @@ def build_subtree_from_course(course, containerdir, chefargs=None):
 
 
 
+def build_subtree_cached(course, containerdir, chefargs=None):
+    """
+    Return the subtree of `course` from SUBTREE_CACHE, or build and cache it.
+    The `update` chef argument forces a rebuild.
+    """
+    update = bool(chefargs and chefargs.get('update'))
+    set_http_cache_update(update)   # here so it also applies in pool worker processes
+    if SUBTREE_CACHE and not update:
+        course_dict = SUBTREE_CACHE.get(course, containerdir)
+        if course_dict:
+            print('Reusing the cached tree of course', course['name'])
+            return course_dict
+    course_dict = build_subtree_from_course(course, containerdir, chefargs=chefargs)
+    if SUBTREE_CACHE and course_dict:
+        SUBTREE_CACHE.put(course, containerdir, course_dict)
+    return course_dict
+
+
+def _caches():
+    return [cache for cache in [PARSE_CACHE, SUBTREE_CACHE] if cache]
+
+
+def _build_subtree_job(indexed_job):
+    index, (course, containerdir, chefargs) = indexed_job
+    for cache in _caches():
+        cache.stats.clear()   # forked workers start with a copy of the parent's counts
+    parse_stats(reset=True)
+    course_dict = build_subtree_cached(course, containerdir, chefargs=chefargs)
+    cache_stats = []
+    for cache in _caches():
+        cache_stats.append(dict(cache.stats))
+        cache.stats.clear()
+    return index, course_dict, cache_stats, parse_stats(reset=True)
+
+
+def build_subtrees(jobs, workers=1, maxtasksperchild=None, done=()):
+    """
+    Yield `(index, course_dict)` for the `(course, containerdir, chefargs)` `jobs`
+    whose index is not in `done`, reusing unchanged subtrees from SUBTREE_CACHE.
+    With `workers` > 1 the courses are built in a process pool whose worker
+    processes are replaced after `maxtasksperchild` courses, and are yielded as
+    they finish (not in order). The cache and parse stats of the workers are
+    added to those of this process.
+    """
+    indexed_jobs = [(index, job) for index, job in enumerate(jobs) if index not in done]
+    if workers <= 1:
+        for index, (course, containerdir, chefargs) in indexed_jobs:
+            yield index, build_subtree_cached(course, containerdir, chefargs=chefargs)
+        return
+    with Pool(processes=workers, maxtasksperchild=maxtasksperchild) as pool:
+        for index, course_dict, cache_stats, stats in pool.imap_unordered(_build_subtree_job, indexed_jobs):
+            for cache, worker_stats in zip(_caches(), cache_stats):
+                cache.stats.update(worker_stats)
+            PARSE_STATS.update(stats)
+            yield index, course_dict
+
+
+
+
+# RUN JOURNAL
+################################################################################
+# pre_run checkpoints every course subtree to disk as soon as it is built, and
+# records it in a journal, so a build that crashed can be restarted with the
+# same options and only builds the courses that were not finished.
+
+RUN_JOURNAL_DIR = 'chefdata/cache/runs'
+
+
+class RunJournal():
+    """
+    Journal and checkpoints of the pre_run build of `jobs` with `run_options`,
+    stored in `journaldir/<run_id>/`. The run_id depends on the options and on
+    the list of courses, so a changed course_list.json starts a new build.
+    """
+    def __init__(self, journaldir, run_options, jobs):
+        run_key = {
+            'options': run_options,
+            'courses': [[course['lang'], course['path']] for course, _, _ in jobs],
+        }
+        self.run_id = hashlib.sha1(json.dumps(run_key, sort_keys=True).encode('utf-8')).hexdigest()[0:12]
+        self.rundir = os.path.join(journaldir, self.run_id)
+        self.journal_path = os.path.join(self.rundir, 'journal.jsonl')
+        self.run_options = run_options
+        self.checkpoints = {}   # job index --> checkpoint path, or None for a skipped course
+
+    def open(self):
+        """
+        Load the journal of an unfinished earlier build, or start a new one.
+        Returns the set of job indices whose subtree is checkpointed.
+        """
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break   # last line cut short by the crash
+                    if record['event'] == 'course':
+                        self.checkpoints[record['index']] = record['checkpoint']
+            for index, checkpoint_path in list(self.checkpoints.items()):
+                course_dict = self.load(index)
+                if checkpoint_path and (course_dict is None or
+                        not all(os.path.exists(path) for path in _iter_subtree_paths(course_dict))):
+                    del self.checkpoints[index]
+            print('Resuming build', self.run_id, 'with', len(self.checkpoints), 'finished courses')
+        else:
+            os.makedirs(self.rundir, exist_ok=True)
+            self._append(event='start', options=self.run_options,
+                         started=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        return set(self.checkpoints.keys())
+
+    def _append(self, **record):
+        with open(self.journal_path, 'a') as journal_file:
+            journal_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def load(self, index):
+        checkpoint_path = self.checkpoints.get(index)
+        if not checkpoint_path:
+            return None
+        try:
+            with open(checkpoint_path) as checkpoint_file:
+                return json.load(checkpoint_file)
+        except (OSError, ValueError):
+            return None
+
+    def checkpoint(self, index, course, course_dict):
+        """Save the `course_dict` of job `index` (None if the course was skipped)."""
+        checkpoint_path = None
+        if course_dict:
+            checkpoint_path = os.path.join(self.rundir, '{}.json'.format(index))
+            with open(checkpoint_path + '.tmp', 'w') as checkpoint_file:
+                json.dump(course_dict, checkpoint_file, ensure_ascii=False)
+            os.replace(checkpoint_path + '.tmp', checkpoint_path)
+        self.checkpoints[index] = checkpoint_path
+        self._append(event='course', index=index, lang=course['lang'], name=course['name'],
+                     checkpoint=checkpoint_path, finished=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    def finish(self):
+        """Remove the journal and checkpoints once the json trees are written."""
+        shutil.rmtree(self.rundir, ignore_errors=True)
+
+
+
+
+# VALIDATE
+################################################################################
+# Runs only the checks of the build (course XML parsing, the course structure and
+# HPLIFE_COURSE_STRUCTURE_CHECK_STRINGS title checks in `parse_course_tree`, and
+# the activity folder lookups) for all courses, without transforms or network calls.
+
+VALIDATION_REPORT_PATH = 'chefdata/validation_report.json'
+
+
+def validate_course(course, containerdir):
+    """
+    Validate one `course` from `course_list.json` and return a report dict.
+    """
+    lang = course['lang']
+    coursedir, contentdir = get_course_dirs(course, containerdir)
+    report = dict(
+        lang=lang,
+        name=course['name'],
+        path=course['path'],
+        source_id=None,
+        display_name=None,
+        ok=False,
+        error=None,
+        missing_activity_refs=[],
+        missing_story_ids=[],
+    )
+    try:
+        course_data = extract_course_tree(coursedir, cache=PARSE_CACHE)
+    except Exception as e:
+        report['error'] = 'parse: {}: {}'.format(type(e).__name__, e)
+        return report
+    report['source_id'] = course_data.get('course')
+    report['display_name'] = course_data.get('display_name')
+    try:
+        parsed_tree = parse_course_tree(course_data, lang)
+    except (AssertionError, IndexError, KeyError) as e:
+        report['error'] = 'structure: {}: {}'.format(type(e).__name__, e)
+        return report
+    if not os.path.isdir(contentdir):
+        report['error'] = 'content: no content dir ' + contentdir
+        return report
+    content_index = ContentIndex(contentdir)
+    try:
+        missing_activity_refs, missing_story_ids = check_activity_refs(
+            course_data, parsed_tree, contentdir, download=False, content_index=content_index)
+    except (AssertionError, KeyError) as e:
+        report['error'] = 'activities: {}: {}'.format(type(e).__name__, e)
+        return report
+    report['missing_activity_refs'] = missing_activity_refs
+    report['missing_story_ids'] = missing_story_ids
+    if content_index.ambiguous:
+        report['ambiguous_activity_refs'] = content_index.ambiguous
+    if missing_activity_refs:
+        report['candidate_folders'] = content_index.candidate_folders
+        report['near_misses'] = {activity_ref: content_index.near_misses(activity_ref)
+                                 for activity_ref in missing_activity_refs}
+    report['ok'] = not missing_activity_refs and not missing_story_ids
+    return report
+
+
+def _validate_course_job(job):
+    course, containerdir = job
+    return validate_course(course, containerdir)
+
+
+def validate(langs=HPLIFE_LANGS, max_workers=None, report_path=VALIDATION_REPORT_PATH):
+    """
+    Validate all the courses of `langs` in parallel using `max_workers` processes
+    and write a JSON report to `report_path`. Returns the report.
+    """
+    start = time.time()
+    jobs = []
+    for lang in langs:
+        containerdir = os.path.join(COURSES_DIR, lang)
+        course_list_path = os.path.join(containerdir, 'course_list.json')
+        if not os.path.exists(course_list_path):
+            print('No course_list.json for lang', lang)
+            continue
+        with open(course_list_path) as course_list_file:
+            course_list = json.load(course_list_file)
+        for course in course_list['courses']:
+            jobs.append((course, containerdir))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        course_reports = list(executor.map(_validate_course_job, jobs, chunksize=4))
+
+    summary = {}
+    for course_report in course_reports:
+        lang_summary = summary.setdefault(course_report['lang'], dict(courses=0, ok=0, failed=0))
+        lang_summary['courses'] += 1
+        lang_summary['ok' if course_report['ok'] else 'failed'] += 1
+    report = dict(
+        created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        elapsed=round(time.time() - start, 2),
+        langs=list(langs),
+        summary=summary,
+        courses=course_reports,
+    )
+    if report_path:
+        with open(report_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2, ensure_ascii=False)
+
+    for course_report in course_reports:
+        if not course_report['ok']:
+            print('FAILED', course_report['lang'], course_report['name'], '-',
+                  course_report['error'] or 'missing activity folders {} story ids {}'.format(
+                      course_report['missing_activity_refs'], course_report['missing_story_ids']))
+    for lang, lang_summary in summary.items():
+        print('{}: {ok}/{courses} courses valid'.format(lang, **lang_summary))
+    print('Validated {} courses in {:.1f}s; report saved to {}'.format(
+          len(course_reports), report['elapsed'], report_path))
+    return report
+
+
+
+
 # CHEF
 ################################################################################
 
@@ -727,36 +1242,77 @@ class HPLifeChef(JsonTreeChef):
         return json_tree_path
 
     def pre_run(self, args, options):
+        """
+        Build the json tree of the channel of the `lang` option, or of the
+        channels of all HPLIFE_LANGS when `lang=all`. In the latter case the
+        courses of all languages are built on the same worker pool.
+        """
         if 'lang' not in options:
-            raise ValueError('Must specify lang option in ' + str(HPLIFE_LANGS))
+            raise ValueError('Must specify lang option in ' + str(HPLIFE_LANGS) + ' or all')
         lang = options['lang']
-        assert lang in HPLIFE_LANGS
+        assert lang in HPLIFE_LANGS or lang == 'all'
+        langs = HPLIFE_LANGS if lang == 'all' else [lang]
+        workers = int(options.get('workers', BUILD_WORKERS))
+        maxtasksperchild = int(options.get('maxtasksperchild', BUILD_MAXTASKSPERCHILD)) or None
 
         if not os.path.exists(self.TREES_DATA_DIR):
             os.makedirs(self.TREES_DATA_DIR)
 
-        ricecooker_json_tree = dict(
-            title=CHANNEL_TITLE_LOOKUP[lang],
-            source_domain='life-global.org',
-            source_id='hp-life-courses-{}'.format(lang),
-            description=CHANNEL_DESCRIPTION_LOOKUP[lang],
-            thumbnail='chefdata/thumbnails/new_channel_thumbnail.png',
-            language=lang,
-            children=[],
-        )
-        print('in pre_run; channel info = ', ricecooker_json_tree)
-
-        containerdir = os.path.join(COURSES_DIR, lang)
-        course_list = json.load(open(os.path.join(containerdir, 'course_list.json')))
-        for course in course_list['courses']:
-            course_dict = build_subtree_from_course(course, containerdir, chefargs=args)
-            if course_dict:
-                ricecooker_json_tree['children'].append(course_dict)
+        channel_trees = {}
+        jobs = []
+        for lang in langs:
+            containerdir = os.path.join(COURSES_DIR, lang)
+            course_list_path = os.path.join(containerdir, 'course_list.json')
+            if len(langs) > 1 and not os.path.exists(course_list_path):
+                print('WARNING: Skipping lang', lang, 'because it has no course_list.json')
+                continue
+            ricecooker_json_tree = dict(
+                title=CHANNEL_TITLE_LOOKUP[lang],
+                source_domain='life-global.org',
+                source_id='hp-life-courses-{}'.format(lang),
+                description=CHANNEL_DESCRIPTION_LOOKUP[lang],
+                thumbnail='chefdata/thumbnails/new_channel_thumbnail.png',
+                language=lang,
+                children=[],
+            )
+            print('in pre_run; channel info = ', ricecooker_json_tree)
+            channel_trees[lang] = ricecooker_json_tree
+            course_list = json.load(open(course_list_path))
+            for course in course_list['courses']:
+                jobs.append((course, containerdir, args))
+
+        run_options = dict(lang=options['lang'], update=bool(args.get('update')))
+        journal = RunJournal(RUN_JOURNAL_DIR, run_options, jobs)
+        done = journal.open()
+        course_dicts = {index: journal.load(index) for index in done}
+        for index, course_dict in build_subtrees(jobs, workers, maxtasksperchild, done=done):
+            journal.checkpoint(index, jobs[index][0], course_dict)
+            course_dicts[index] = course_dict
+
+        for index, (course, _, _) in enumerate(jobs):
+            if course_dicts[index]:
+                channel_trees[course['lang']]['children'].append(course_dicts[index])
             else:
                 print('WARNING: Skipping course', course['name'], 'because it failed to pre-validate')
-        json_tree_path = self.get_json_tree_path(lang=lang)
-        write_tree_to_json_tree(json_tree_path, ricecooker_json_tree)
-
+        for lang, ricecooker_json_tree in channel_trees.items():
+            json_tree_path = self.get_json_tree_path(lang=lang)
+            write_tree_to_json_tree(json_tree_path, ricecooker_json_tree)
+        journal.finish()
+        for cache in _caches():
+            cache.report(reset=True)
+        print('Course XML files opened, read, and parsed:', parse_stats(reset=True))
+
+    def run(self, args, options):
+        """
+        With `lang=all` only build the json trees of all channels, since each
+        channel is uploaded by a separate `lang=<lang>` run.
+        """
+        if options.get('lang') == 'all':
+            self.pre_run(args, options)
+            print('Built the json trees of the channels in', self.TREES_DATA_DIR,
+                  '- run the chef with lang=<lang> to upload a channel')
+            return
+        super().run(args, options)
 
     # def run(self, args, options):
     #     self.pre_run(args, options)
@@ -768,6 +1324,18 @@ if __name__ == '__main__':
     """
     Run this script on the command line using:
     ./suschichef.py -v --reset --thumbnails --token=<YOURTOKENHERE>  lang=es
+    or to only check the courses of all languages (no network needed):
+    ./suschichef.py validate
     """
+    if len(sys.argv) > 1 and sys.argv[1] == 'validate':
+        # ./sushichef.py validate [--langs es fr] [--workers 8] [--report path]
+        import argparse
+        parser = argparse.ArgumentParser(description='Validate HP LIFE courses without building')
+        parser.add_argument('--langs', nargs='+', choices=HPLIFE_LANGS, default=HPLIFE_LANGS)
+        parser.add_argument('--workers', type=int, default=None, help='processes (default: all CPUs)')
+        parser.add_argument('--report', default=VALIDATION_REPORT_PATH, help='JSON report path')
+        args = parser.parse_args(sys.argv[2:])
+        report = validate(langs=args.langs, max_workers=args.workers, report_path=args.report)
+        sys.exit(0 if all(course_report['ok'] for course_report in report['courses']) else 1)
     chef = HPLifeChef()
     chef.main()
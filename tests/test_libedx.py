@@ -0,0 +1,39 @@
+import itertools
+import os
+
+import pytest
+
+import libedx
+
+
+FIXTURE_COURSEDIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'course')
+
+CONFIGS = list(itertools.product(libedx.XML_BACKENDS, [False, True], libedx.NODE_MODELS))
+
+
+def load_fixture_course(monkeypatch, backend, lazy, node_model):
+    monkeypatch.setattr(libedx, 'XML_BACKEND', backend)
+    monkeypatch.setattr(libedx, 'LAZY_HTML_CONTENT', lazy)
+    monkeypatch.setattr(libedx, 'NODE_MODEL', node_model)
+    return libedx.dumps_course(libedx.extract_course_tree(FIXTURE_COURSEDIR))
+
+
+@pytest.mark.parametrize('backend,lazy,node_model', CONFIGS[1:])
+def test_course_tree_parity(monkeypatch, backend, lazy, node_model):
+    expected = load_fixture_course(monkeypatch, *CONFIGS[0])
+    assert load_fixture_course(monkeypatch, backend, lazy, node_model) == expected
+
+
+@pytest.mark.parametrize('kind,name', [
+    ('chapter', 'ch_activities'),
+    ('vertical', 'vert_activities'),
+    ('problem', 'prob_storyline'),
+    ('problem', 'prob_hpstoryline'),
+])
+def test_xml_file_parity(monkeypatch, kind, name):
+    parse_fn = libedx.parse_problem_file if kind == 'problem' else libedx.parse_xml_file
+    outputs = []
+    for backend in libedx.XML_BACKENDS:
+        monkeypatch.setattr(libedx, 'XML_BACKEND', backend)
+        outputs.append(libedx.dumps_course(parse_fn(FIXTURE_COURSEDIR, kind, name)))
+    assert all(output == outputs[0] for output in outputs)
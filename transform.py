@@ -12,9 +12,11 @@ from urllib.parse import unquote_plus
 from urllib.parse import urljoin
 
 
+from cachecontrol.caches.file_cache import FileCache
 from html2text import html2text
 
 from le_utils.constants import content_kinds, file_types, licenses
+from ricecooker.utils.caching import CacheControlAdapter, CacheForeverHeuristic
 from ricecooker.utils.zip import create_predictable_zip
 from ricecooker.utils.html_writer import HTMLWriter
 
@@ -36,6 +38,60 @@ import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
+# HTTP CACHE
+################################################################################
+# All GET requests go through SESSION, which keeps the responses forever in
+# HTTP_CACHE_DIR so the Storyline CDN scripts, story pages, images, and resource
+# files shared by courses and languages are downloaded only once (also across
+# chef runs and worker processes). Runs with the `update` chef argument call
+# `set_http_cache_update(True)` to download every URL again (once per process).
+
+HTTP_CACHE_DIR = 'chefdata/cache/http'
+
+
+class RefreshingCacheControlAdapter(CacheControlAdapter):
+    """
+    Drops the cached response of each URL the first time it is requested, so
+    it is downloaded again and the fresh response is cached for later requests.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.refreshed_urls = set()
+
+    def send(self, request, **kwargs):
+        if request.method == 'GET' and request.url not in self.refreshed_urls:
+            self.refreshed_urls.add(request.url)
+            try:
+                self.cache.delete(self.controller.cache_url(request.url))
+            except FileNotFoundError:
+                pass
+        return super().send(request, **kwargs)
+
+
+SESSION = requests.Session()
+_http_cache = FileCache(HTTP_CACHE_DIR)
+_http_cache_update = None
+
+
+def set_http_cache_update(update):
+    """
+    Use the cached responses (`update=False`), or download each URL again
+    the first time it is requested in this process (`update=True`).
+    """
+    global _http_cache_update
+    update = bool(update)
+    if update == _http_cache_update:
+        return
+    adapter_class = RefreshingCacheControlAdapter if update else CacheControlAdapter
+    adapter = adapter_class(heuristic=CacheForeverHeuristic(), cache=_http_cache)
+    SESSION.mount('http://', adapter)
+    SESSION.mount('https://', adapter)
+    _http_cache_update = update
+
+
+set_http_cache_update(False)
+
+
 
 # TOP-LEVEL FUNCTION
 ################################################################################
@@ -381,7 +437,7 @@ def transform_articulate_storyline_folder(contentdir, activity_ref):
     for script in headscripts:
         script_url = script['src']
         script_basename = os.path.basename(script_url)
-        response = requests.get(script_url, verify=False)
+        response = SESSION.get(script_url, verify=False)
         with open(os.path.join(scriptsdir, script_basename), 'wb') as scriptfile:
             scriptfile.write(response.content)
         scriptrelpath = os.path.join('scripts', script_basename)
@@ -480,7 +536,7 @@ def localize_image_refs(webroot):
             img_src = img['src'].strip()
             if img_src.startswith('http'):
                 img_basename = os.path.basename(img_src)
-                response = requests.get(img_src, verify=False)
+                response = SESSION.get(img_src, verify=False)
                 with open(os.path.join(imagesdir, img_basename), 'wb') as imgfile:
                     imgfile.write(response.content)
                 imgrelpath = os.path.join('imagesdir', img_basename)
@@ -497,7 +553,7 @@ def localize_image_refs(webroot):
         img_url = matchobj.group(0)[1:-1]
         img_basename = os.path.basename(img_url)
         try:
-            response = requests.get(img_url, verify=False)
+            response = SESSION.get(img_url, verify=False)
             with open(os.path.join(imagesdir, img_basename), 'wb') as imgfile:
                 imgfile.write(response.content)
                 imgrelpath = os.path.join('imagesdir', img_basename)
@@ -552,7 +608,7 @@ def download_hpstoryline(contentdir, story_id):
 
 
     source_url = HPSTORYLINE_BASE_URL + story_id
-    html = requests.get(source_url, verify=False).text
+    html = SESSION.get(source_url, verify=False).text
     doc = BeautifulSoup(html, 'html5lib')
 
     # A. Localize js libs
@@ -566,7 +622,7 @@ def download_hpstoryline(contentdir, story_id):
             script_basename = os.path.basename(script_url)
             destpath = os.path.join(scriptsdir, script_basename)
             if not os.path.exists(destpath):
-                response = requests.get(script_url, verify=False)
+                response = SESSION.get(script_url, verify=False)
                 script_src = response.text
                 edited_script_src = script_src.replace('/assets', 'assets')
                 with open(destpath, 'w') as scriptfile:
@@ -585,7 +641,7 @@ def download_hpstoryline(contentdir, story_id):
         destpath = os.path.join(assetsdir, style_basename)
 
         if not os.path.exists(destpath):
-            response = requests.get(style_url, verify=False)
+            response = SESSION.get(style_url, verify=False)
             if response.status_code == 200:
                 style_str = response.text
                 new_style_str = css_rewriter(style_str, source_url, destdir)
@@ -639,7 +695,7 @@ def download_hpstoryline(contentdir, story_id):
     overlay_url = 'https://hpstoryline.edcastcloud.com/assets/' + overlay_basename
     destpath = os.path.join(assetsdir, overlay_basename)
     if not os.path.exists(destpath):
-        response = requests.get(overlay_url, verify=False)
+        response = SESSION.get(overlay_url, verify=False)
         if response.status_code == 200:
             with open(destpath, 'wb') as overlayimgfile:
                 overlayimgfile.write(response.content)
@@ -670,7 +726,7 @@ def img_rewriter(div, source_url, mediadir):
             img_basename = img_basename.replace('%20','_')
         destpath = os.path.join(mediadir, img_basename)
         if not os.path.exists(destpath):
-            response = requests.get(img_url, verify=False)
+            response = SESSION.get(img_url, verify=False)
             if response.status_code == 200:
                 with open(destpath, 'wb') as imgfile:
                     imgfile.write(response.content)
@@ -710,7 +766,7 @@ def css_rewriter(style_str, source_url, destdir):
         resource_basename = os.path.basename(resource_url)
         destpath = os.path.join(assetsdir, resource_basename)
         if not os.path.exists(destpath):
-            response = requests.get(resource_url, verify=False)
+            response = SESSION.get(resource_url, verify=False)
             if response.status_code == 200:
                 with open(destpath, 'wb') as resourcefile:
                     resourcefile.write(response.content)
@@ -759,7 +815,7 @@ def extract_and_download_mp3path(jscode_str, destdir, mediadirname=MEDIA_DIR_NAM
     if found:
         destpath = os.path.join(destdir, assets_path)
         if not os.path.exists(destpath):
-            response = requests.get(mp3path, verify=False)
+            response = SESSION.get(mp3path, verify=False)
             with open(destpath, 'wb') as destfile:
                 destfile.write(response.content)
                 print('Saved file to', destpath)
@@ -941,7 +997,7 @@ def get_resources_from_downloadable_resouces_item(contentdir, item, course_id):
         else:
             url = href
 
-        response = requests.head(url)
+        response = SESSION.head(url)
         if response.ok:
             if 'Content-Type' in response.headers:
                 content_type = response.headers['Content-Type']
@@ -1081,7 +1137,7 @@ def download_resource(resource, contentdir, update=False):
         if DEBUG_MODE:
             print('Downloading resource from', download_url)
         # go GET a sample.docx
-        response = requests.get(download_url, verify=False)
+        response = SESSION.get(download_url, verify=False)
         if response.ok:
             with open(destpath, 'wb') as localfile:
                 localfile.write(response.content)